@@ -0,0 +1,379 @@
+import math
+import sqlite3
+import threading
+import time
+from collections import deque
+
+import numpy as np
+import pandas as pd
+
+from metrics import count_error, timed
+from portfolio import PORTFOLIO_DB
+
+# --- ALERT CONFIGURATION ---
+MAX_EVENTS = 500               # recent firings kept in memory for the UI
+
+# Rule metric -> (label, input fields, value from a ticker's field dict).
+# Inputs: price / week_pct / month_pct (get_performance_data), pe / sector_pe
+# (get_stock_data_safe + sector index), high_52 (price history) and cost (lots).
+METRICS = {
+    'price': ("Price", ('price',), lambda f: f['price']),
+    'cost_pct': ("% From Cost Basis", ('price', 'cost'),
+                 lambda f: (f['price'] / f['cost'] - 1) * 100 if f['cost'] > 0 else math.nan),
+    'week_pct': ("1 Week %", ('week_pct',), lambda f: f['week_pct']),
+    'month_pct': ("1 Month %", ('month_pct',), lambda f: f['month_pct']),
+    'high_discount': ("52W High Discount %", ('price', 'high_52'),
+                      lambda f: (f['high_52'] - f['price']) / f['high_52'] * 100 if f['high_52'] > 0 else math.nan),
+    'pe_vs_sector': ("P/E vs Sector Avg %", ('pe', 'sector_pe'),
+                     lambda f: (f['pe'] / f['sector_pe'] - 1) * 100 if f['pe'] > 0 and f['sector_pe'] > 0 else math.nan),
+}
+OPERATORS = ('<', '>')
+
+# Input field -> metrics to re-evaluate when it changes
+DEPENDENTS = {}
+for _metric, (_, _inputs, _) in METRICS.items():
+    for _field in _inputs:
+        DEPENDENTS.setdefault(_field, []).append(_metric)
+FIELDS = tuple(DEPENDENTS)
+
+
+class _Bucket:
+    """Every rule on one (ticker, metric) as parallel arrays, so a tick compares one
+    value against all their thresholds in a single vectorized step. Additions are
+    appended to lists and compiled on the next evaluation."""
+
+    def __init__(self):
+        self.rules = []        # (rule id, threshold, below, starts active)
+        self.ids = self.thresholds = self.below = None
+        self.active = np.empty(0, dtype=bool)
+
+    def add(self, rule_id, op, threshold, active=False):
+        self.rules.append((rule_id, threshold, op == '<', active))
+        self.ids = None
+
+    def remove(self, rule_id):
+        self._compile()
+        keep = self.ids != rule_id
+        self.rules = [r for r, k in zip(self.rules, keep) if k]
+        self.active = self.active[keep]
+        self.ids = None
+        return len(self.rules)
+
+    def _compile(self):
+        if self.ids is None:
+            ids, thresholds, below, active = zip(*self.rules) if self.rules else ((), (), (), ())
+            self.ids = np.array(ids, dtype=np.int64)
+            self.thresholds = np.array(thresholds, dtype=np.float64)
+            self.below = np.array(below, dtype=bool)
+            # Existing rules keep their state; new ones take the state they were added with
+            self.active = np.concatenate([self.active, np.array(active[len(self.active):], dtype=bool)])
+
+    def evaluate(self, value):
+        """Indexes of rules that just became true (edge-triggered: a rule fires once
+        when its condition starts holding and re-arms when it stops)."""
+        self._compile()
+        if math.isnan(value):
+            hit = np.zeros(len(self.ids), dtype=bool)
+        else:
+            hit = np.where(self.below, value < self.thresholds, value > self.thresholds)
+        fired = np.flatnonzero(hit & ~self.active)
+        self.active = hit
+        return fired
+
+    def is_active(self, rule_id):
+        self._compile()
+        return bool(self.active[self.ids == rule_id].any())
+
+
+class RuleIndex:
+    """Compiled rules keyed by (ticker, metric). A tick only touches the buckets of
+    metrics whose inputs changed for that ticker, never the whole rule set."""
+
+    def __init__(self):
+        self.buckets = {}      # (ticker, metric) -> _Bucket
+        self.rules = {}        # rule id -> (ticker, metric, op, threshold)
+        self.fields = {}       # ticker -> latest input fields
+        self.values = {}       # (ticker, metric) -> latest metric value
+
+    def add(self, rule_id, ticker, metric, op, threshold, active=False):
+        """active=True marks a rule whose condition already held (it fires again only
+        after the condition has stopped holding once)."""
+        if metric not in METRICS or op not in OPERATORS:
+            raise ValueError(f"Unknown alert rule {metric} {op}")
+        self.rules[rule_id] = (ticker, metric, op, float(threshold))
+        self.buckets.setdefault((ticker, metric), _Bucket()).add(rule_id, op, float(threshold), active)
+
+    def remove(self, rule_id):
+        rule = self.rules.pop(rule_id, None)
+        if rule is None:
+            return False
+        key = rule[:2]
+        if not self.buckets[key].remove(rule_id):
+            del self.buckets[key]
+        return True
+
+    def tickers(self):
+        return sorted({t for t, _ in self.buckets})
+
+    def needs(self, field):
+        """Tickers with at least one rule depending on field."""
+        metrics = set(DEPENDENTS.get(field, ()))
+        return sorted({t for t, m in self.buckets if m in metrics})
+
+    def tick(self, ticker, **fields):
+        """Applies new input values for ticker and returns the rules that fired as
+        (rule id, metric value) pairs."""
+        current = self.fields.setdefault(ticker, dict.fromkeys(FIELDS, math.nan))
+        changed = set()
+        for field, value in fields.items():
+            value = math.nan if value is None else float(value)
+            old = current.get(field, math.nan)
+            if value != old and not (math.isnan(value) and math.isnan(old)):
+                current[field] = value
+                changed.add(field)
+
+        fired = []
+        for metric in {m for f in changed for m in DEPENDENTS.get(f, ())}:
+            bucket = self.buckets.get((ticker, metric))
+            if bucket is None:
+                continue
+            try:
+                value = float(METRICS[metric][2](current))
+            except (TypeError, ZeroDivisionError):
+                value = math.nan
+            self.values[(ticker, metric)] = value
+            fired += [(int(bucket.ids[i]), value) for i in bucket.evaluate(value)]
+        return fired
+
+    def value(self, rule_id):
+        rule = self.rules.get(rule_id)
+        return self.values.get(rule[:2], math.nan) if rule else math.nan
+
+    def is_active(self, rule_id):
+        rule = self.rules.get(rule_id)
+        if rule is None:
+            return False
+        return self.buckets[rule[:2]].is_active(rule_id)
+
+
+class AlertEngine:
+    """Alert rules persisted next to the portfolio lots, compiled into a RuleIndex
+    and fed by every performance refresh. Firings are kept in a short in-memory log
+    and stamped on the rule's row.
+
+    Edge state is not stored, so on load a rule that has ever fired (last_fired is
+    set) starts active: one whose condition still holds does not fire again after a
+    restart, and re-arms once the condition stops holding."""
+
+    def __init__(self, path=PORTFOLIO_DB):
+        self.path = path
+        self.lock = threading.Lock()
+        self.index = RuleIndex()
+        self.events = deque(maxlen=MAX_EVENTS)
+        self.sequence = 0
+        self.fired_at = {}     # rule id -> last firing not yet written to the table
+        with self._connect() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS alert_rules (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    ticker TEXT NOT NULL,
+                    metric TEXT NOT NULL,
+                    op TEXT NOT NULL,
+                    threshold REAL NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_fired REAL
+                )
+            """)
+            rows = conn.execute(
+                "SELECT id, ticker, metric, op, threshold, last_fired IS NOT NULL FROM alert_rules"
+            ).fetchall()
+        for row in rows:
+            try:
+                self.index.add(*row)
+            except ValueError:
+                pass
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    # --- Rules ---
+
+    def add_rule(self, ticker, metric, op, threshold):
+        """Stores and indexes a rule; returns its id."""
+        if metric not in METRICS or op not in OPERATORS:
+            raise ValueError(f"Unknown alert rule {metric} {op}")
+        with self._connect() as conn:
+            rule_id = conn.execute(
+                "INSERT INTO alert_rules (ticker, metric, op, threshold, created_at) VALUES (?, ?, ?, ?, ?)",
+                (ticker, metric, op, float(threshold), time.time())
+            ).lastrowid
+        with self.lock:
+            self.index.add(rule_id, ticker, metric, op, threshold)
+            # Evaluate against values already seen instead of waiting for the next change
+            fields = self.index.fields.pop(ticker, None)
+            if fields:
+                self._record(ticker, self.index.tick(ticker, **fields))
+        return rule_id
+
+    def add_rules(self, rules):
+        """Bulk add_rule for (ticker, metric, op, threshold) tuples, in one IMMEDIATE
+        transaction; returns their ids."""
+        rules = [(t, m, o, float(x)) for t, m, o, x in rules]
+        for _, metric, op, _ in rules:
+            if metric not in METRICS or op not in OPERATORS:
+                raise ValueError(f"Unknown alert rule {metric} {op}")
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            ids = [
+                conn.execute(
+                    "INSERT INTO alert_rules (ticker, metric, op, threshold, created_at) VALUES (?, ?, ?, ?, ?)",
+                    rule + (now,)
+                ).lastrowid
+                for rule in rules
+            ]
+        with self.lock:
+            for rule_id, rule in zip(ids, rules):
+                self.index.add(rule_id, *rule)
+            # Evaluate against values already seen, as add_rule does
+            for ticker in dict.fromkeys(rule[0] for rule in rules):
+                fields = self.index.fields.pop(ticker, None)
+                if fields:
+                    self._record(ticker, self.index.tick(ticker, **fields))
+        return ids
+
+    def remove_rule(self, rule_id):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM alert_rules WHERE id = ?", (int(rule_id),))
+        with self.lock:
+            return self.index.remove(int(rule_id))
+
+    def rules(self):
+        """Every rule with its latest metric value and whether it currently holds."""
+        self.flush()
+        with self._connect() as conn:
+            df = pd.read_sql_query(
+                "SELECT id AS 'Rule', ticker AS 'Ticker', metric, op AS 'Op', threshold AS 'Threshold', "
+                "last_fired FROM alert_rules ORDER BY id", conn
+            )
+        with self.lock:
+            df['Value'] = [self.index.value(r) for r in df['Rule']]
+            df['Triggered'] = [self.index.is_active(r) for r in df['Rule']]
+        df.insert(2, 'Metric', df.pop('metric').map(lambda m: METRICS.get(m, (m,))[0]))
+        df['Last Fired'] = pd.to_datetime(df.pop('last_fired'), unit='s')
+        return df
+
+    def tickers(self):
+        with self.lock:
+            return self.index.tickers()
+
+    def needs(self, field):
+        with self.lock:
+            return self.index.needs(field)
+
+    # --- Ticks ---
+
+    def tick(self, ticker, **fields):
+        """Feeds new input values for one ticker; returns the events it fired."""
+        with self.lock:
+            return self._record(ticker, self.index.tick(ticker, **fields))
+
+    def update(self, fields):
+        """Feeds a frame of input fields (index: ticker, columns: any of FIELDS).
+        Rows for tickers without rules are skipped; returns every fired event."""
+        fired = []
+        with self.lock:
+            watched = {t for t, _ in self.index.buckets}
+            frame = fields[fields.index.isin(watched)]
+            for ticker, row in zip(frame.index, frame.to_dict('records')):
+                fired += self._record(ticker, self.index.tick(ticker, **row))
+        self.flush()
+        return fired
+
+    def _record(self, ticker, fired):
+        # caller holds self.lock
+        if not fired:
+            return []
+        now = time.time()
+        events = []
+        for rule_id, value in fired:
+            _, metric, op, threshold = self.index.rules[rule_id]
+            self.sequence += 1
+            events.append({
+                'seq': self.sequence, 'rule': rule_id, 'ticker': ticker, 'metric': metric,
+                'op': op, 'threshold': threshold, 'value': value, 'time': now,
+            })
+        self.events.extend(events)
+        self.fired_at.update((e['rule'], now) for e in events)
+        return events
+
+    def flush(self):
+        """Writes pending last_fired stamps in one statement (ticks stay in memory)."""
+        with self.lock:
+            pending, self.fired_at = self.fired_at, {}
+        if not pending:
+            return
+        try:
+            with self._connect() as conn:
+                conn.executemany("UPDATE alert_rules SET last_fired = ? WHERE id = ?", [(t, r) for r, t in pending.items()])
+        except Exception as e:
+            count_error('alerts.flush', e)
+
+    def events_since(self, seq=0):
+        with self.lock:
+            return [e for e in self.events if e['seq'] > seq]
+
+    def last_seq(self):
+        """Sequence number of the newest event (0 before any has fired)."""
+        with self.lock:
+            return self.sequence
+
+
+def describe(event):
+    """One-line text for a fired event."""
+    label = METRICS[event['metric']][0]
+    return f"{event['ticker']}: {label} {event['value']:.2f} {event['op']} {event['threshold']:g}"
+
+
+def collect_fields(engine, perf, cost=None, sector_averages=None):
+    """Input fields for the rule tickers in a performance frame (get_performance_bulk
+    rows). Fundamentals and 52-week highs are only looked up for tickers that have
+    rules needing them."""
+    from market_data import HISTORY, get_stock_data_many
+
+    tickers = [t for t in engine.tickers() if t in perf.index]
+    fields = pd.DataFrame(index=pd.Index(tickers, dtype=object))
+    if not tickers:
+        return fields
+    # A 0 price is get_performance_data's "no quote", not a real value
+    fields['price'] = perf.loc[tickers, 'Current Price'].where(lambda p: p > 0)
+    fields['week_pct'] = perf.loc[tickers, '1 Week %'].where(fields['price'].notna())
+    fields['month_pct'] = perf.loc[tickers, '1 Month %'].where(fields['price'].notna())
+    if cost is not None:
+        fields['cost'] = pd.Series(cost, dtype=float).reindex(tickers)
+
+    wanted = set(tickers)
+    high_tickers = [t for t in engine.needs('high_52') if t in wanted]
+    if high_tickers:
+        fields['high_52'] = pd.Series({t: HISTORY.high(t) for t in high_tickers}, dtype=float)
+
+    pe_tickers = [t for t in engine.needs('pe') if t in wanted]
+    if pe_tickers:
+        data, _ = get_stock_data_many(pe_tickers)
+        if not data.empty:
+            data = data.set_index('ticker')
+            fields['pe'] = pd.to_numeric(data['pe'], errors='coerce')
+            if sector_averages is not None:
+                fields['sector_pe'] = data['sector'].map(lambda s: sector_averages(s)[0]).astype(float)
+    return fields
+
+
+def evaluate_refresh(engine, perf, cost_fn=None, sector_averages=None):
+    """Prefetch listener: turns a performance refresh into alert ticks."""
+    try:
+        with timed('alerts.evaluate'):
+            cost = cost_fn() if cost_fn else None
+            return engine.update(collect_fields(engine, perf, cost, sector_averages))
+    except Exception as e:
+        count_error('alerts.evaluate', e)
+        return []
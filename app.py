@@ -1,515 +1,576 @@
+import time
+BOOT_STARTED = time.time()  # app init is timed from here, before streamlit and pandas load
+
 import streamlit as st
 import pandas as pd
-from finvizfinance.screener.valuation import Valuation
-import yfinance as yf
-from textblob import TextBlob
-import time
-import subprocess
-import sys
-import os
-from datetime import datetime, timedelta
+import re
+from datetime import datetime
+from startup import PRELOAD, import_report, preload
+from cache import get_cache
+from health import UpstreamUnavailable, get_breaker, health_snapshot
+from metrics import METRICS, METRICS_PORT, count_error, start_metrics_server, timed
+from portfolio import PortfolioStore
+from alerts import AlertEngine, describe
 
 # --- 1. CONFIGURATION ---
 st.set_page_config(page_title="Market Hunter & Analyst", layout="wide")
 
+# Data libraries (yfinance, finvizfinance, pyarrow, textblob) load on the first page
+# that needs them; STOCKPICKER_PRELOAD=1 warms them at boot instead.
 @st.cache_resource
-def download_textblob_corpora():
-    try:
-        subprocess.check_call([sys.executable, "-m", "textblob.download_corpora"])
-    except Exception as e:
-        pass 
+def boot():
+    if PRELOAD:
+        preload()
+    return time.time() - BOOT_STARTED
+
+BOOT_SECONDS = boot()
+
+CACHE = get_cache()
+
+@st.cache_resource
+def get_sector_index():
+    from sector_stats import SectorStatsIndex
+    return SectorStatsIndex()
+
+@st.cache_resource
+def get_universe():
+    from universe import get_universe_snapshot
+    return get_universe_snapshot()
+
+@st.cache_resource
+def get_portfolio_store():
+    return PortfolioStore()
+
+PORTFOLIO = get_portfolio_store()
+
+@st.cache_resource
+def get_alert_engine():
+    return AlertEngine()
 
-download_textblob_corpora()
+ALERTS = get_alert_engine()
+
+@st.cache_resource
+def get_prefetcher():
+    from alerts import evaluate_refresh
+    from portfolio import cost_basis
+    from prefetch import PrefetchScheduler
+    sector_index = get_sector_index()
+    prefetcher = PrefetchScheduler(lambda: PORTFOLIO.tickers() + ALERTS.tickers())
+    # Every refresh (background or "Refresh") re-evaluates only the rules on tickers whose values moved
+    prefetcher.subscribe(lambda perf: evaluate_refresh(
+        ALERTS, perf, lambda: cost_basis(PORTFOLIO.lots()), sector_index.averages))
+    prefetcher.start()
+    return prefetcher
+
+# Alert rules need the background refresh even when no page that uses it is open
+if ALERTS.tickers():
+    get_prefetcher()
 
 # --- 2. HELPER FUNCTIONS ---
 
 def load_portfolio():
-    if os.path.exists('my_portfolio.csv'):
-        return pd.read_csv('my_portfolio.csv')
-    else:
-        return pd.DataFrame(columns=['Ticker', 'Date Added', 'Price Added'])
+    return PORTFOLIO.lots()
 
 def save_to_portfolio(ticker, current_price):
-    df = load_portfolio()
     try:
         price_float = float(current_price)
     except:
         price_float = 0.0
         
-    if ticker not in df['Ticker'].values:
-        new_row = pd.DataFrame({
-            'Ticker': [ticker], 
-            'Date Added': [datetime.now().strftime("%Y-%m-%d")],
-            'Price Added': [price_float]
-        })
-        df = pd.concat([df, new_row], ignore_index=True)
-        df.to_csv('my_portfolio.csv', index=False)
-        return True
-    return False
+    return PORTFOLIO.add_if_missing(ticker, price_float)
 
 def remove_from_portfolio(ticker):
-    df = load_portfolio()
-    df = df[df['Ticker'] != ticker]
-    df.to_csv('my_portfolio.csv', index=False)
-
-def get_performance_data(ticker):
-    stock = yf.Ticker(ticker)
-    current_price = 0.0
-    change_1w = 0.0
-    change_1m = 0.0
-    
-    try:
-        current_price = stock.fast_info['last_price']
-        
-        hist = stock.history(period="2mo")
-        if not hist.empty:
-            week_ago = datetime.now() - timedelta(days=7)
-            week_idx = hist.index.get_indexer([week_ago], method='nearest')[0]
-            price_1w = hist['Close'].iloc[week_idx]
-            
-            month_ago = datetime.now() - timedelta(days=30)
-            month_idx = hist.index.get_indexer([month_ago], method='nearest')[0]
-            price_1m = hist['Close'].iloc[month_idx]
-
-            if price_1w > 0:
-                change_1w = ((current_price - price_1w) / price_1w) * 100
-            if price_1m > 0:
-                change_1m = ((current_price - price_1m) / price_1m) * 100
-    except:
-        pass
-        
-    return current_price, change_1w, change_1m
+    PORTFOLIO.remove_ticker(ticker)
 
-def get_stock_data_safe(ticker):
-    """Fetches comprehensive stock info safely."""
-    try:
-        stock = yf.Ticker(ticker)
-        info = stock.info
-        
-        name = info.get('longName', info.get('shortName', ticker))
-        
-        # --- CALCULATE ADVANCED METRICS ---
-        
-        # 1. Net Debt / EBITDA
-        total_debt = info.get('totalDebt', 0)
-        total_cash = info.get('totalCash', 0)
-        ebitda = info.get('ebitda', 0)
-        
-        if ebitda and ebitda > 0:
-            net_debt = total_debt - total_cash
-            debt_ebitda = net_debt / ebitda
-        else:
-            debt_ebitda = 0 # N/A
-            
-        # 2. EV / FCF
-        ev = info.get('enterpriseValue', 0)
-        fcf = info.get('freeCashFlow', 0)
-        
-        if fcf and fcf > 0:
-            ev_fcf = ev / fcf
-        else:
-            ev_fcf = 0 # N/A or Negative Cash Flow
-            
-        data = {
-            'ticker': ticker,
-            'name': name,
-            'price': info.get('currentPrice', 0),
-            'sector': info.get('sector', 'Unknown'),
-            'pe': info.get('trailingPE', 0),
-            'pb': info.get('priceToBook', 0),
-            'mc': info.get('marketCap', 0),
-            # NEW METRICS
-            'revenue_growth': info.get('revenueGrowth', 0), # Percentage
-            'operating_margin': info.get('operatingMargins', 0), # Percentage
-            'debt_ebitda': debt_ebitda,
-            'ev_fcf': ev_fcf
-        }
-        
-        # Clean Nones
-        for k, v in data.items():
-            if v is None: data[k] = 0
-            
-        return data
-    except:
+def background_sentiment(key):
+    """Sentiment frame from the background job stored under key, or None while it
+    runs (a polling fragment then reruns the page once it finishes)."""
+    job = st.session_state.get(key)
+    if job is None:
         return None
+    if job.done():
+        return None if job.exception() else job.result()
+    
+    @st.fragment(run_every=2)
+    def poll():
+        if job.done():
+            st.rerun()
+        st.caption("📰 Scoring news sentiment in the background...")
+    poll()
+    return None
 
 def get_sector_averages(sector_name):
-    """Fetches average P/E and P/B for a sector via Finviz."""
+    """Average P/E and P/B for a sector from the precomputed sector index."""
     try:
-        screener = Valuation()
-        screener.set_filter(filters_dict={'Sector': sector_name})
-        sector_df = screener.screener_view()
-        
-        sector_df['P/E'] = pd.to_numeric(sector_df['P/E'], errors='coerce')
-        sector_df['P/B'] = pd.to_numeric(sector_df['P/B'], errors='coerce')
-        
-        return sector_df['P/E'].mean(), sector_df['P/B'].mean()
-    except:
-        return 0, 0
+        return get_sector_index().averages(sector_name)
+    except Exception as e:
+        count_error('sector_averages', e)
+        return None, None
 
 # --- 3. APP NAVIGATION ---
 st.sidebar.title("Navigation")
-page = st.sidebar.radio("Go to:", ["🔍 Market Scanner", "📈 My Portfolio", "⚖️ Stock Analyst"])
+page = st.sidebar.radio("Go to:", ["🔍 Market Scanner", "📈 My Portfolio", "⚖️ Stock Analyst", "🔔 Alerts"])
+
+# Upstreams whose circuit is open: calls fail fast and cached data is shown instead
+for upstream in health_snapshot():
+    if upstream['state'] != 'closed':
+        st.sidebar.warning(f"⚠️ {upstream['upstream'].title()} is unavailable, retrying in {upstream['retry_in'] or 0:.0f}s. Cached data is shown where available.")
+
+# Alerts fired since this session last looked (a new session starts from now, not
+# from the whole event buffer)
+if 'alerts_seen' not in st.session_state:
+    st.session_state['alerts_seen'] = ALERTS.last_seq()
+for event in ALERTS.events_since(st.session_state['alerts_seen']):
+    st.toast(f"🔔 {describe(event)}")
+    st.session_state['alerts_seen'] = event['seq']
+
+page_start = time.perf_counter()
 
 # ==========================================
 # PAGE: MARKET SCANNER
 # ==========================================
 if page == "🔍 Market Scanner":
+    from scanner import enrich_scan_rows, run_screen
+    from sentiment import submit_sentiment
+    from universe import STRATEGIES, SORT_MAP, MARKET_CAPS, build_filters
+    
+    UNIVERSE = get_universe()
     st.title("🌍 True Market Scanner")
     
     st.sidebar.markdown("---")
     st.sidebar.header("Scanner Settings")
     
-    strategy = st.sidebar.selectbox(
-        "1. Choose Strategy:",
-        ["Custom (Manual)", 
-         "Insider Buying (Follow the Money)", 
-         "Oversold Quality (Dip Buying)", 
-         "Short Squeeze (High Risk/Reward)"]
-    )
+    data_source = st.sidebar.radio("Data Source", ["Live Finviz", "Local Snapshot"], horizontal=True)
+    if data_source == "Local Snapshot":
+        UNIVERSE.refresh_async()
+        snapshot_age = UNIVERSE.age()
+        if snapshot_age is None:
+            st.sidebar.caption("Downloading market snapshot in the background...")
+        else:
+            st.sidebar.caption(f"Snapshot age: {snapshot_age / 60:.0f} min")
+    
+    strategy = st.sidebar.selectbox("1. Choose Strategy:", list(STRATEGIES))
     
-    sort_criteria = st.sidebar.selectbox(
-        "2. Sort Market By:",
-        ["Lowest P/E (Cheapest Earnings)", 
-         "Lowest P/B (Cheapest Assets)", 
-         "Worst Performance (Biggest Discount)"]
-    )
+    sort_criteria = st.sidebar.selectbox("2. Sort Market By:", list(SORT_MAP))
     
     sector_list = ["Any", "Basic Materials", "Communication Services", "Consumer Cyclical", "Consumer Defensive", "Energy", "Financial", "Healthcare", "Industrials", "Real Estate", "Technology", "Utilities"]
     sector_option = st.sidebar.selectbox("Sector", sector_list, index=0)
     
-    mc_option = st.sidebar.selectbox("Market Cap", ["Any", "Micro ($50mln to $300mln)", "Small ($300mln to $2bln)", "Mid ($2bln to $10bln)", "Large ($10bln to $200bln)"], index=0)
+    mc_option = st.sidebar.selectbox("Market Cap", MARKET_CAPS, index=0)
     
+    pe_option = pb_option = debt_option = "Any"
     if strategy == "Custom (Manual)":
         pe_option = st.sidebar.selectbox("P/E Ratio", ["Any", "Under 15", "Under 20", "Under 30"], index=0)
         pb_option = st.sidebar.selectbox("Price/Book", ["Any", "Under 1", "Under 2", "Under 3"], index=0)
         debt_option = st.sidebar.selectbox("Debt/Equity", ["Any", "Under 0.5", "Under 1"], index=0)
     
-    max_stocks = st.sidebar.slider("Max Stocks to Analyze", 5, 20, 10)
+    max_stocks = st.sidebar.slider("Max Stocks to Analyze", 5, 1000, 10, step=5)
 
     if 'scan_results' not in st.session_state:
         st.session_state['scan_results'] = None
 
+    # Sidebar choices shared by the scan and the backtest
+    selections = {
+        'Sector': sector_option,
+        'Market Cap.': mc_option,
+        'P/E': pe_option,
+        'P/B': pb_option,
+        'Debt/Equity': debt_option,
+    }
+
+    with st.expander("📜 Backtest this strategy on stored snapshots"):
+        st.caption("Replays the strategy over every dated market snapshot in the local store and "
+                   "measures the picks with locally stored price history (no downloads).")
+        if st.button("Run Backtest"):
+            from backtest import load_closes, load_snapshot_history, price_coverage, sweep
+            with st.spinner("Backtesting..."), timed("backtest.sweep"):
+                history = load_snapshot_history(UNIVERSE.directory)
+                tickers = list(history['Ticker'].astype(str).unique())
+                closes = load_closes(tickers) if tickers else pd.DataFrame()
+                if history.empty or closes.empty:
+                    st.warning("Not enough local data yet: needs dated snapshots and stored price history "
+                               "(`python backtest.py --backfill` downloads it for every snapshot ticker).")
+                else:
+                    coverage = price_coverage(tickers, closes)
+                    st.caption(f"{history['Date'].nunique()} snapshots, price history for {coverage * 100:.0f}% of "
+                               f"{len(tickers)} tickers (picks without it count as unpriced)")
+                    st.dataframe(sweep(history, closes, strategies=[strategy], selections=selections, top_n=max_stocks)
+                                 .drop(columns='Strategy'), hide_index=True, use_container_width=True)
+
     if st.button("Run Scan", type="primary"):
         status = st.empty()
-        status.info("Screening via Finviz...")
+        status.info("Screening via Finviz..." if data_source == "Live Finviz" else "Screening local snapshot...")
         
-        filters_dict = {}
-        
-        if strategy == "Custom (Manual)":
-            if sector_option != "Any": filters_dict['Sector'] = sector_option
-            if mc_option != "Any": filters_dict['Market Cap.'] = mc_option
-            if pe_option != "Any": filters_dict['P/E'] = pe_option
-            if pb_option != "Any": filters_dict['P/B'] = pb_option
-            if debt_option != "Any": filters_dict['Debt/Equity'] = debt_option
-            
-        elif strategy == "Insider Buying (Follow the Money)":
-            filters_dict['InsiderTransactions'] = 'Positive (>0%)' 
-            filters_dict['P/B'] = 'Under 3'
-            if mc_option != "Any": filters_dict['Market Cap.'] = mc_option
-            
-        elif strategy == "Oversold Quality (Dip Buying)":
-            filters_dict['RSI (14)'] = 'Oversold (30)'
-            filters_dict['Debt/Equity'] = 'Under 0.5'
-            filters_dict['Net Profit Margin'] = 'Positive (>0%)'
-            if mc_option != "Any": filters_dict['Market Cap.'] = mc_option
-            
-        elif strategy == "Short Squeeze (High Risk/Reward)":
-            filters_dict['Float Short'] = 'High (>20%)'
-            filters_dict['Performance'] = 'Today Up'
-            if mc_option != "Any": filters_dict['Market Cap.'] = mc_option
-
-        screener = Valuation()
-        if filters_dict:
-            screener.set_filter(filters_dict=filters_dict)
-            
-        sort_map = {
-            "Lowest P/E (Cheapest Earnings)": "Price/Earnings", 
-            "Lowest P/B (Cheapest Assets)": "Price/Book", 
-            "Worst Performance (Biggest Discount)": "Performance (Year)"
-        }
-        sort_key = sort_map.get(sort_criteria, 'Price/Earnings')
+        filters_dict = build_filters(strategy, selections)
+        sort_key = SORT_MAP.get(sort_criteria, 'Price/Earnings')
 
         try:
-            df_results = screener.screener_view(order=sort_key)
+            source = 'live' if data_source == "Live Finviz" else 'snapshot'
+            with timed(f"scanner.screen.{source}"):
+                df_results = run_screen(filters_dict, order=sort_key, source=source, universe=UNIVERSE)
             
             if not df_results.empty:
-                enriched_data = []
                 subset = df_results.head(max_stocks)
                 progress = st.progress(0)
                 
-                for i, (idx, row) in enumerate(subset.iterrows()):
-                    progress.progress((i+1)/len(subset))
-                    
-                    discount_str = "-"
-                    current_price = float(row.get('Price', 0))
-                    
-                    try:
-                        tinfo = yf.Ticker(row['Ticker']).info
-                        high_52 = tinfo.get('fiftyTwoWeekHigh', 0)
-                        current_price = tinfo.get('currentPrice', current_price)
-                        
-                        if high_52 > 0:
-                            disc_val = ((high_52 - current_price) / high_52) * 100
-                            discount_str = f"🔻 {disc_val:.1f}%"
-                    except:
-                        pass
-                    
-                    enriched_data.append({
-                        'Ticker': row['Ticker'],
-                        'Price': current_price,
-                        'P/E': row.get('P/E', '-'),
-                        'P/B': row.get('P/B', '-'),
-                        'Discount_Str': discount_str
-                    })
-                    time.sleep(0.1)
+                with timed("scanner.enrich"):
+                    enriched_data = enrich_scan_rows(
+                        subset,
+                        on_progress=lambda done, total: progress.progress(done / total)
+                    )
                 
                 progress.empty()
                 st.session_state['scan_results'] = pd.DataFrame(enriched_data)
+                get_prefetcher().watch(st.session_state['scan_results']['Ticker'])
+                st.session_state['scan_sentiment'] = submit_sentiment(st.session_state['scan_results']['Ticker'])
                 status.success("Scan Complete!")
             else:
                 st.session_state['scan_results'] = pd.DataFrame()
                 status.warning("No stocks found.")
                 
+        except UpstreamUnavailable as e:
+            st.error(f"{e}. The Local Snapshot data source still works.")
         except Exception as e:
+            count_error("scanner.run", e)
             st.error(f"Error: {e}")
 
-    if st.session_state['scan_results'] is not None and not st.session_state['scan_results'].empty:
-        st.write("### Scan Results")
-        h1, h2, h3, h4, h5, h6 = st.columns([1, 1, 1.5, 1, 1, 1])
-        h1.markdown("**Ticker**")
-        h2.markdown("**Price**")
-        h3.markdown("**52W Discount**")
-        h4.markdown("**P/E**")
-        h5.markdown("**P/B**")
-        h6.markdown("**Action**")
-        st.divider()
+    results_df = st.session_state['scan_results']
+    if results_df is not None and not results_df.empty:
+        st.write(f"### Scan Results ({len(results_df)})")
+        stale_rows = int(results_df.get('Stale', pd.Series(dtype=bool)).sum())
+        if stale_rows:
+            st.caption(f"⚠️ {stale_rows} rows use cached Yahoo data from before the current outage.")
+        sentiment = background_sentiment('scan_sentiment')
         
-        for idx, row in st.session_state['scan_results'].iterrows():
-            c1, c2, c3, c4, c5, c6 = st.columns([1, 1, 1.5, 1, 1, 1])
-            c1.write(f"**{row['Ticker']}**")
-            c2.write(f"${row['Price']}")
-            c3.write(f"**{row['Discount_Str']}**")
-            c4.write(f"{row['P/E']}")
-            c5.write(f"{row['P/B']}")
-            
-            def add_callback(t, p):
-                if save_to_portfolio(t, p):
-                    st.toast(f"✅ Saved {t}!")
-                else:
-                    st.toast(f"⚠️ {t} already saved.")
-            
-            c6.button(f"Add", key=f"btn_{row['Ticker']}", on_click=add_callback, args=(row['Ticker'], row['Price']))
-            st.divider()
+        # One virtualized grid instead of a widget row per ticker; selecting rows
+        # only reruns the script, nothing is written until "Add Selected".
+        event = st.dataframe(
+            pd.DataFrame({
+                "Ticker": results_df['Ticker'],
+                "Price": pd.to_numeric(results_df['Price'], errors='coerce'),
+                "52W Discount %": pd.to_numeric(results_df['Discount'], errors='coerce'),
+                "P/E": pd.to_numeric(results_df['P/E'], errors='coerce'),
+                "P/B": pd.to_numeric(results_df['P/B'], errors='coerce'),
+                "News Sentiment": results_df['Ticker'].map(sentiment['Sentiment']) if sentiment is not None else None,
+            }),
+            hide_index=True,
+            use_container_width=True,
+            key="scan_grid",
+            on_select="rerun",
+            selection_mode="multi-row",
+            column_config={
+                "Price": st.column_config.NumberColumn(format="$%.2f"),
+                "52W Discount %": st.column_config.NumberColumn(format="🔻 %.1f%%"),
+                "P/E": st.column_config.NumberColumn(format="%.2f"),
+                "P/B": st.column_config.NumberColumn(format="%.2f"),
+                "News Sentiment": st.column_config.NumberColumn(format="%.2f", help="Mean TextBlob polarity of recent headlines (-1 to 1)."),
+            }
+        )
+        
+        selected = results_df.iloc[event.selection.rows]
+        if st.button(f"Add Selected ({len(selected)})", key="add_selected", disabled=selected.empty):
+            saved = PORTFOLIO.add_many(zip(selected['Ticker'], pd.to_numeric(selected['Price'], errors='coerce').fillna(0.0)))
+            skipped = len(selected) - len(saved)
+            if saved:
+                st.toast(f"✅ Saved {', '.join(saved[:10])}{'...' if len(saved) > 10 else ''}!")
+            if skipped:
+                st.toast(f"⚠️ {skipped} already saved.")
 
 # ==========================================
 # PAGE: MY PORTFOLIO
 # ==========================================
 elif page == "📈 My Portfolio":
+    from market_data import get_performance_bulk, get_sectors
+    from portfolio import DEFAULT_ACCOUNT, positions, sector_exposure, value_lots
+    
+    PREFETCH = get_prefetcher()
     st.title("📈 My Stock Tracker")
+    
+    with st.expander("➕ Add Lot"):
+        with st.form("add_lot", clear_on_submit=True):
+            c1, c2, c3, c4 = st.columns(4)
+            lot_ticker = c1.text_input("Ticker").strip().upper()
+            lot_qty = c2.number_input("Quantity", min_value=0.0, value=1.0, step=1.0)
+            lot_price = c3.number_input("Price Paid (0 = current)", min_value=0.0, value=0.0)
+            lot_account = c4.text_input("Account", value=DEFAULT_ACCOUNT).strip()
+            if st.form_submit_button("Add") and lot_ticker:
+                PORTFOLIO.add_lot(lot_ticker, lot_price, quantity=lot_qty, account=lot_account)
+                PREFETCH.trigger()
+                st.toast(f"✅ Added {lot_qty:g} {lot_ticker}")
+    
     df_p = load_portfolio()
     
     if df_p.empty:
         st.info("Portfolio empty.")
     else:
-        if st.button("🔄 Refresh"):
-            st.rerun()
-            
-        results = []
-        for idx, row in df_p.iterrows():
-            cur, w, m = get_performance_data(row['Ticker'])
-            
-            try:
-                added = float(row['Price Added'])
-            except:
-                added = 0.0
-                
-            if added == 0: added = cur
-            
-            ret_abs = cur - added
-            ret_pct = (ret_abs / added) * 100 if added > 0 else 0
-            
-            results.append({
-                "Ticker": row['Ticker'],
-                "Current Price": cur,
-                "Cost Basis": added,
-                "Gain/Loss $": ret_abs,
-                "Gain/Loss %": ret_pct,
-                "1 Week %": w,
-                "1 Month %": m
-            })
-            
-        st.dataframe(pd.DataFrame(results), use_container_width=True, hide_index=True)
+        refresh = st.button("🔄 Refresh")
         
-        to_rem = st.selectbox("Remove:", ["Select..."] + list(df_p['Ticker']))
-        if st.button("Remove"):
+        # Served from the shared background snapshot. An explicit refresh rebuilds it;
+        # when it is missing a holding or too old, only this portfolio's tickers are
+        # computed here and the worker is woken to catch up
+        held_tickers = list(df_p['Ticker'].cat.categories)
+        perf, age = PREFETCH.snapshot(held_tickers)
+        if refresh:
+            with timed("portfolio.performance"):
+                perf, age = PREFETCH.refresh(), 0.0
+            # The shared refresh also covers watched and alert tickers
+            perf = perf[perf.index.isin(held_tickers)]
+        elif perf is None:
+            with timed("portfolio.performance"):
+                perf, age = get_performance_bulk(held_tickers), 0.0
+            PREFETCH.trigger()
+        st.caption(f"Prices updated {age / 60:.0f} min ago")
+        if perf['Stale'].any():
+            st.warning(f"⚠️ Price history could not be refreshed for {int(perf['Stale'].sum())} tickers; their last stored prices are shown.")
+        
+        accounts = list(df_p['Account'].cat.categories)
+        if len(accounts) > 1:
+            shown = st.multiselect("Accounts", accounts, default=accounts)
+            df_p = df_p[df_p['Account'].isin(shown)]
+        
+        # Every figure below is a column-wise aggregate over the lots frame
+        with timed("portfolio.valuation"):
+            valued = value_lots(df_p, perf['Current Price'])
+            held = positions(valued)
+            held['1 Week %'] = held['Ticker'].astype(str).map(perf['1 Week %'])
+            held['1 Month %'] = held['Ticker'].astype(str).map(perf['1 Month %'])
+        
+        # Lots without a quote have no value, so their cost is left out of the totals too
+        quoted = valued['Market Value'].notna()
+        total_value = valued['Market Value'].sum()
+        total_cost = valued.loc[quoted, 'Cost'].sum()
+        m1, m2, m3 = st.columns(3)
+        m1.metric("Market Value", f"${total_value:,.2f}")
+        m2.metric("Cost Basis", f"${total_cost:,.2f}")
+        m3.metric("Unrealized P&L", f"${total_value - total_cost:,.2f}",
+                  f"{(total_value / total_cost - 1) * 100:.2f}%" if total_cost > 0 else None)
+        
+        tab_pos, tab_lots, tab_sec = st.tabs(["Positions", "Lots", "Sector Exposure"])
+        with tab_pos:
+            st.dataframe(held[['Ticker', 'Quantity', 'Avg Cost', 'Market Value', 'Gain/Loss $', 'Gain/Loss %',
+                               'Weight %', '1 Week %', '1 Month %']], use_container_width=True, hide_index=True)
+        with tab_lots:
+            st.dataframe(valued[['Lot', 'Account', 'Ticker', 'Date Added', 'Quantity', 'Price Added', 'Current Price',
+                                 'Market Value', 'Gain/Loss $', 'Gain/Loss %']], use_container_width=True, hide_index=True)
+        with tab_sec:
+            sectors = get_sectors(held['Ticker'].astype(str), get_universe().load())
+            exposure = sector_exposure(valued, sectors)
+            st.bar_chart(exposure, x='Sector', y='Weight %')
+            st.dataframe(exposure, use_container_width=True, hide_index=True)
+        
+        st.download_button("Export CSV", PORTFOLIO.export_csv(), file_name="my_portfolio.csv", mime="text/csv")
+        
+        c1, c2 = st.columns(2)
+        to_rem = c1.selectbox("Remove:", ["Select..."] + list(held['Ticker'].astype(str)))
+        if c1.button("Remove"):
             if to_rem != "Select...":
                 remove_from_portfolio(to_rem)
                 st.rerun()
+        lot_rem = c2.selectbox("Remove lot:", ["Select..."] + list(valued['Lot']))
+        if c2.button("Remove Lot"):
+            if lot_rem != "Select...":
+                PORTFOLIO.remove_lot(lot_rem)
+                st.rerun()
 
 # ==========================================
 # PAGE: STOCK ANALYST (ADVANCED)
 # ==========================================
 elif page == "⚖️ Stock Analyst":
+    from market_data import get_stock_data_many
+    from scoring import METRICS as SCORE_METRICS, score_frame, sector_percentiles
+    from sentiment import submit_sentiment
+    
+    SECTOR_INDEX = get_sector_index()
     st.title("⚖️ Pro Comparative Analyst")
-    st.write("Head-to-Head Comparison with Advanced Metrics")
+    st.write("N-Way Comparison with Advanced Metrics")
     
-    c1, c2 = st.columns(2)
-    with c1:
-        ticker_a = st.text_input("Stock A (e.g. KO)", "").upper()
-    with c2:
-        ticker_b = st.text_input("Stock B (Optional, e.g. PEP)", "").upper()
+    SECTOR_INDEX.refresh_async()
+    if SECTOR_INDEX.built_at:
+        st.caption(f"Sector stats as of {datetime.fromtimestamp(SECTOR_INDEX.built_at):%Y-%m-%d %H:%M}")
+    else:
+        st.caption("Sector stats are being built in the background...")
+    
+    tickers_str = st.text_area("Tickers to compare (comma or space separated, up to 100)", "", placeholder="KO, PEP, MDLZ")
+    
+    with st.expander("Scoring Weights"):
+        weights = {}
+        for col, (metric, (label, better, default)) in zip(st.columns(len(SCORE_METRICS)), SCORE_METRICS.items()):
+            weights[metric] = col.slider(f"{label} ({better}er is better)", 0.0, 3.0, default, 0.5)
+        sector_relative = st.checkbox("Score against each stock's whole sector instead of this list", value=False)
     
     if st.button("Analyze & Compare", type="primary"):
-        if not ticker_a:
-            st.warning("Please enter at least Stock A.")
+        tickers = [t for t in re.split(r"[,\s]+", tickers_str.upper()) if t][:100]
+        if not tickers:
+            st.warning("Please enter at least one ticker.")
         else:
-            tickers = [ticker_a]
-            if ticker_b: tickers.append(ticker_b)
-            
-            stock_data = {}
-            with st.spinner("Crunching Advanced Metrics (Cash Flow, Debt, Margins)..."):
-                for t in tickers:
-                    data = get_stock_data_safe(t)
-                    if data:
-                        stock_data[t] = data
-                    else:
-                        st.error(f"Could not find {t}")
-            
-            if stock_data:
-                # --- COMPARISON MODE ---
-                if len(stock_data) == 2:
-                    da = stock_data[ticker_a]
-                    db = stock_data[ticker_b]
-                    
-                    st.divider()
-                    st.subheader(f"⚔️ Face-Off: {da['name']} vs {db['name']}")
-                    
-                    colA, colB = st.columns(2)
-                    score_a, score_b = 0, 0
-                    
-                    with colA:
-                        st.markdown(f"### {da['ticker']}")
-                        st.write(f"Price: **${da['price']}**")
-                        st.write(f"Sector: {da['sector']}")
-                    with colB:
-                        st.markdown(f"### {db['ticker']}")
-                        st.write(f"Price: **${db['price']}**")
-                        st.write(f"Sector: {db['sector']}")
-
-                    st.markdown("---")
-                    st.write("### 📊 Fundamental Breakdown")
-
-                    # 1. VALUATION (P/E & P/B)
-                    c1, c2, c3 = st.columns([2, 1, 2])
-                    c1.metric("P/E Ratio", f"{da['pe']:.2f}")
-                    c3.metric("P/E Ratio", f"{db['pe']:.2f}")
-                    if da['pe'] > 0 and db['pe'] > 0:
-                        if da['pe'] < db['pe']: 
-                            c2.success(f"👈 {da['ticker']} Cheaper")
-                            score_a += 1
-                        else: 
-                            c2.success(f"{db['ticker']} Cheaper 👉")
-                            score_b += 1
-                    elif da['pe'] > 0: 
-                        c2.success(f"👈 {da['ticker']} Profitable")
-                        score_a += 1
-                    elif db['pe'] > 0:
-                        c2.success(f"{db['ticker']} Profitable 👉")
-                        score_b += 1
-
-                    st.divider()
-                    
-                    # 2. CASH FLOW (EV/FCF)
-                    c1, c2, c3 = st.columns([2, 1, 2])
-                    val_a = f"{da['ev_fcf']:.1f}x" if da['ev_fcf'] > 0 else "N/A"
-                    val_b = f"{db['ev_fcf']:.1f}x" if db['ev_fcf'] > 0 else "N/A"
-                    
-                    c1.metric("EV / Free Cash Flow", val_a, help="Lower is better. Measures price relative to real cash generated.")
-                    c3.metric("EV / Free Cash Flow", val_b)
-                    
-                    if da['ev_fcf'] > 0 and db['ev_fcf'] > 0:
-                        if da['ev_fcf'] < db['ev_fcf']:
-                            c2.success(f"👈 Better Cash Value")
-                            score_a += 1
-                        else:
-                            c2.success(f"Better Cash Value 👉")
-                            score_b += 1
-                    
-                    st.divider()
-
-                    # 3. GROWTH & MARGINS
-                    c1, c2, c3 = st.columns([2, 1, 2])
-                    c1.metric("Revenue Growth", f"{da['revenue_growth']*100:.1f}%")
-                    c3.metric("Revenue Growth", f"{db['revenue_growth']*100:.1f}%")
-                    if da['revenue_growth'] > db['revenue_growth']:
-                        c2.success(f"👈 Faster Growth")
-                        score_a += 1
-                    else:
-                        c2.success(f"Faster Growth 👉")
-                        score_b += 1
-                        
-                    st.write("")
-                    c1, c2, c3 = st.columns([2, 1, 2])
-                    c1.metric("Operating Margin", f"{da['operating_margin']*100:.1f}%")
-                    c3.metric("Operating Margin", f"{db['operating_margin']*100:.1f}%")
-                    if da['operating_margin'] > db['operating_margin']:
-                        c2.success(f"👈 More Efficient")
-                        score_a += 1
-                    else:
-                        c2.success(f"More Efficient 👉")
-                        score_b += 1
-                        
-                    st.divider()
-
-                    # 4. SOLVENCY (DEBT/EBITDA)
-                    c1, c2, c3 = st.columns([2, 1, 2])
-                    c1.metric("Net Debt / EBITDA", f"{da['debt_ebitda']:.2f}", help="Lower is better. Under 3.0 is usually safe.")
-                    c3.metric("Net Debt / EBITDA", f"{db['debt_ebitda']:.2f}")
-                    
-                    # Logic: Lower debt ratio is better
-                    if da['debt_ebitda'] < db['debt_ebitda']:
-                        c2.success(f"👈 Safer Balance Sheet")
-                        score_a += 1
-                    else:
-                        c2.success(f"Safer Balance Sheet 👉")
-                        score_b += 1
-
-                    # WINNER DECLARATION
-                    st.markdown("---")
-                    st.write("### 🏆 Final Verdict")
-                    if score_a > score_b:
-                        st.balloons()
-                        st.success(f"**WINNER: {da['name']} ({score_a} - {score_b})**")
-                        st.write(f"{da['ticker']} wins on fundamentals.")
-                    elif score_b > score_a:
-                        st.balloons()
-                        st.success(f"**WINNER: {db['name']} ({score_b} - {score_a})**")
-                        st.write(f"{db['ticker']} wins on fundamentals.")
-                    else:
-                        st.warning("It's a Tie! Both companies have mixed strengths.")
-
-                    # Add Buttons
-                    c1, c2 = st.columns(2)
-                    if c1.button(f"Add {ticker_a}"): save_to_portfolio(ticker_a, da['price']); st.toast("Saved!")
-                    if c2.button(f"Add {ticker_b}"): save_to_portfolio(ticker_b, db['price']); st.toast("Saved!")
-
-                # --- SINGLE STOCK MODE (Simple View) ---
-                elif len(stock_data) == 1:
-                    d = list(stock_data.values())[0]
-                    st.subheader(f"Analysis: {d['name']}")
-                    
-                    c1, c2, c3 = st.columns(3)
-                    c1.metric("P/E Ratio", f"{d['pe']:.2f}")
-                    c2.metric("EV / Free Cash Flow", f"{d['ev_fcf']:.1f}x")
-                    c3.metric("Net Debt / EBITDA", f"{d['debt_ebitda']:.2f}")
-                    
-                    c1, c2, c3 = st.columns(3)
-                    c1.metric("Revenue Growth", f"{d['revenue_growth']*100:.1f}%")
-                    c2.metric("Operating Margin", f"{d['operating_margin']*100:.1f}%")
-                    c3.metric("Market Cap", f"${d['mc']/1e9:.1f}B")
-                    
-                    st.write("---")
-                    if st.button(f"Add {d['ticker']}"):
-                        save_to_portfolio(d['ticker'], d['price'])
-                        st.toast("Saved!")
+            with st.spinner(f"Crunching Advanced Metrics for {len(tickers)} stocks (Cash Flow, Debt, Margins)..."):
+                with timed("analyst.fundamentals"):
+                    stock_data, missing = get_stock_data_many(tickers)
+            if missing:
+                if not get_breaker('yahoo').is_available():
+                    st.error(f"Yahoo is unavailable, no cached data for {', '.join(missing)}")
+                else:
+                    st.error(f"Could not find {', '.join(missing)}")
+            if not stock_data.empty and stock_data['stale'].any():
+                st.warning(f"⚠️ Cached data (Yahoo unavailable): {', '.join(stock_data.loc[stock_data['stale'], 'ticker'])}")
+            st.session_state['analyst_data'] = stock_data
+            if not stock_data.empty:
+                st.session_state['analyst_sentiment'] = submit_sentiment(stock_data['ticker'])
+    
+    stock_data = st.session_state.get('analyst_data')
+    if stock_data is not None and not stock_data.empty:
+        board = score_frame(stock_data, weights, SECTOR_INDEX if sector_relative else None)
+        sentiment = background_sentiment('analyst_sentiment')
+        
+        st.divider()
+        st.subheader("🏆 Leaderboard")
+        if len(board) > 1:
+            top = board.iloc[0]
+            st.success(f"**Top pick: {top['name']} ({top['ticker']}) with {top['Score']:.0f}/100**")
+        
+        st.dataframe(
+            pd.DataFrame({
+                "Rank": board['Rank'],
+                "Ticker": board['ticker'],
+                "Name": board['name'],
+                "Sector": board['sector'],
+                "Score": board['Score'],
+                "Price": board['price'],
+                "P/E": board['pe'].where(board['pe'] > 0),
+                "EV/FCF": board['ev_fcf'].where(board['ev_fcf'] > 0),
+                "Revenue Growth %": board['revenue_growth'] * 100,
+                "Operating Margin %": board['operating_margin'] * 100,
+                "Net Debt/EBITDA": board['debt_ebitda'],
+                "Market Cap $B": board['mc'] / 1e9,
+                "News Sentiment": board['ticker'].map(sentiment['Sentiment']) if sentiment is not None else None,
+            }),
+            hide_index=True,
+            use_container_width=True,
+            column_config={
+                "Score": st.column_config.ProgressColumn("Score", min_value=0, max_value=100, format="%.0f"),
+                "Price": st.column_config.NumberColumn(format="$%.2f"),
+                "P/E": st.column_config.NumberColumn(format="%.2f"),
+                "EV/FCF": st.column_config.NumberColumn(format="%.1fx", help="Lower is better. Measures price relative to real cash generated."),
+                "Revenue Growth %": st.column_config.NumberColumn(format="%.1f%%"),
+                "Operating Margin %": st.column_config.NumberColumn(format="%.1f%%"),
+                "Net Debt/EBITDA": st.column_config.NumberColumn(format="%.2f", help="Lower is better. Under 3.0 is usually safe."),
+                "Market Cap $B": st.column_config.NumberColumn(format="%.1f"),
+                "News Sentiment": st.column_config.NumberColumn(format="%.2f", help="Mean TextBlob polarity of recent headlines (-1 to 1)."),
+            }
+        )
+        
+        with st.expander("📊 Sector Percentiles"):
+            pcts = sector_percentiles(board, SECTOR_INDEX).dropna(axis=1, how='all')
+            if pcts.empty or pcts.columns.empty:
+                st.caption("No sector data for these stocks yet.")
+            else:
+                st.caption("Where each metric sits among all stocks in the same sector (0 = lowest, 100 = highest).")
+                st.dataframe(
+                    pd.concat([board[['ticker', 'sector']].set_axis(["Ticker", "Sector"], axis=1),
+                               pcts.rename(columns=lambda m: SCORE_METRICS[m][0])], axis=1),
+                    hide_index=True,
+                    use_container_width=True,
+                    column_config={SCORE_METRICS[m][0]: st.column_config.NumberColumn(format="%.0f") for m in pcts.columns},
+                )
+        
+        to_add = st.multiselect("Add to portfolio:", list(board['ticker']))
+        if st.button("Add Selected") and to_add:
+            prices = board.set_index('ticker')['price']
+            saved = [t for t in to_add if save_to_portfolio(t, prices[t])]
+            st.toast(f"✅ Saved {', '.join(saved)}!" if saved else "⚠️ Already saved.")
+
+# ==========================================
+# PAGE: ALERTS
+# ==========================================
+elif page == "🔔 Alerts":
+    from alerts import METRICS as ALERT_METRICS
+    
+    st.title("🔔 Price Alerts")
+    st.caption("Rules are checked on every price refresh; each one fires once when its condition starts to hold.")
+    
+    with st.form("add_rule", clear_on_submit=True):
+        c1, c2, c3, c4 = st.columns(4)
+        rule_ticker = c1.text_input("Ticker").strip().upper()
+        rule_metric = c2.selectbox("Metric", list(ALERT_METRICS), format_func=lambda m: ALERT_METRICS[m][0])
+        rule_op = c3.selectbox("Condition", ["<", ">"], format_func=lambda o: "below" if o == "<" else "above")
+        rule_threshold = c4.number_input("Threshold", value=0.0)
+        if st.form_submit_button("Add Rule") and rule_ticker:
+            ALERTS.add_rule(rule_ticker, rule_metric, rule_op, rule_threshold)
+            get_prefetcher().trigger()
+            st.toast(f"✅ Watching {rule_ticker}")
+    
+    if st.button("🔄 Check Now"):
+        with timed("alerts.check"):
+            get_prefetcher().refresh()
+        st.rerun()
+    
+    rules = ALERTS.rules()
+    if rules.empty:
+        st.info("No alert rules yet.")
+    else:
+        st.dataframe(rules, use_container_width=True, hide_index=True)
+        to_rem = st.selectbox("Remove rule:", ["Select..."] + list(rules['Rule']))
+        if st.button("Remove"):
+            if to_rem != "Select...":
+                ALERTS.remove_rule(to_rem)
+                st.rerun()
+    
+    events = ALERTS.events_since(0)
+    if events:
+        st.subheader("Recent Alerts")
+        st.dataframe(pd.DataFrame([
+            {"Time": datetime.fromtimestamp(e['time']), "Alert": describe(e)} for e in reversed(events)
+        ]), use_container_width=True, hide_index=True)
+
+# ==========================================
+# SIDEBAR: PERFORMANCE
+# ==========================================
+METRICS.observe(f"page.{page.split(' ', 1)[-1].lower().replace(' ', '_')}", time.perf_counter() - page_start)
+
+@st.cache_resource
+def start_metrics_endpoint():
+    if METRICS_PORT:
+        return start_metrics_server(METRICS_PORT, CACHE.stats, health_snapshot)
+
+start_metrics_endpoint()
+
+with st.sidebar.expander("Performance"):
+    cache_stats = CACHE.stats()
+    lookups = cache_stats['hits'] + cache_stats['misses']
+    hit_rate = cache_stats['hits'] / lookups * 100 if lookups else 0
+    st.caption(f"Cache: {hit_rate:.0f}% hit rate ({cache_stats['hits']} hits / {cache_stats['misses']} misses, {cache_stats['entries']} entries, {cache_stats['coalesced']} coalesced, {cache_stats['stale']} served stale)")
+    
+    snapshot = METRICS.snapshot()
+    if snapshot['calls']:
+        st.dataframe(pd.DataFrame([
+            {
+                "Call": name,
+                "Count": c['count'],
+                "Mean ms": round(c['mean_ms'], 1),
+                "p95 ms": round(c['p95_ms'], 1),
+                "Max ms": round(c['max_ms'], 1),
+                "Errors": c['errors'],
+            }
+            for name, c in snapshot['calls'].items()
+        ]), hide_index=True)
+    upstreams = health_snapshot()
+    st.dataframe(pd.DataFrame([
+        {
+            "Upstream": u['upstream'],
+            "State": u['state'],
+            "Failures": u['failures'],
+            "Rejected": u['rejected'],
+            "Last Error": u['last_error'],
+        }
+        for u in upstreams
+    ]), hide_index=True)
+    other_errors = {k: v for k, v in snapshot['errors'].items() if k not in snapshot['calls']}
+    for name, n in other_errors.items():
+        st.caption(f"⚠️ {name}: {n} errors ({snapshot['last_errors'].get(name, '')})")
+    
+    st.caption(f"App init: {BOOT_SECONDS * 1000:.0f} ms{' (preloaded)' if PRELOAD else ''}")
+    st.dataframe(pd.DataFrame(import_report()), hide_index=True)
+    
+    c1, c2 = st.columns(2)
+    c1.download_button("JSON", METRICS.to_json(cache_stats, upstreams), file_name="metrics.json", mime="application/json")
+    c2.download_button("Prometheus", METRICS.to_prometheus(cache_stats, upstreams), file_name="metrics.prom", mime="text/plain")
@@ -0,0 +1,235 @@
+import argparse
+import glob
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+from universe import UNIVERSE_DIR, STRATEGIES, SORT_MAP, SORT_COLUMNS, FILTER_COLUMNS, build_filters, filter_mask
+
+# --- BACKTEST CONFIGURATION ---
+HORIZONS = (5, 21, 63)         # forward-return horizons in trading days
+TOP_N = 20                     # picks per snapshot date (the scanner's "Max Stocks")
+REBALANCE_DAYS = 21            # trading days a basket is held in the equity curve
+BACKFILL_BATCH = 200           # tickers per bulk download when backfilling the history store
+
+SNAPSHOT_COLUMNS = sorted({'Ticker', *FILTER_COLUMNS.values(), *SORT_COLUMNS.values()})
+
+
+# --- LOCAL DATA ---
+
+def load_snapshot_history(directory=UNIVERSE_DIR, start=None, end=None):
+    """Every dated universe snapshot (YYYY-MM-DD.parquet) as one long frame with a
+    'Date' column; numeric columns are float32 and Ticker / Sector categorical."""
+    frames = []
+    for path in sorted(glob.glob(os.path.join(directory, '*.parquet'))):
+        try:
+            date = pd.Timestamp(os.path.basename(path)[:-len('.parquet')])
+        except ValueError:
+            continue
+        if (start and date < pd.Timestamp(start)) or (end and date > pd.Timestamp(end)):
+            continue
+        df = pd.read_parquet(path)
+        df = df[[c for c in SNAPSHOT_COLUMNS if c in df.columns]]
+        frames.append(df.assign(Date=date))
+    if not frames:
+        return pd.DataFrame(columns=['Date'] + SNAPSHOT_COLUMNS)
+
+    history = pd.concat(frames, ignore_index=True)
+    for col in history.columns:
+        if col in ('Ticker', 'Sector'):
+            history[col] = history[col].astype('category')
+        elif col != 'Date':
+            history[col] = pd.to_numeric(history[col], errors='coerce').astype('float32')
+    return history
+
+def load_closes(tickers, store=None):
+    """Date x ticker closes from the local price-history store (no downloads)."""
+    from price_history import get_history_store
+    return (store or get_history_store()).closes(tickers, update=False)
+
+def price_coverage(tickers, closes):
+    """Share (0-1) of tickers with at least one stored close."""
+    tickers = list(dict.fromkeys(tickers))
+    if not tickers:
+        return 0.0
+    return float(closes.reindex(columns=tickers).notna().any().mean())
+
+def backfill(tickers, store=None, batch=BACKFILL_BATCH):
+    """Downloads stored-history gaps for every snapshot ticker (the app only keeps
+    held, scanned and alert tickers warm), batch tickers per bulk download.
+    Returns the number of tickers written."""
+    from price_history import get_history_store
+    store = store or get_history_store()
+    tickers = list(dict.fromkeys(tickers))
+    written = 0
+    for i in range(0, len(tickers), batch):
+        written += len(store.update(tickers[i:i + batch]))
+    return written
+
+
+# --- ENGINE ---
+
+class SnapshotPanel:
+    """Snapshot history pivoted once into (snapshot date x ticker) matrices over every
+    ticker any snapshot lists, so every strategy is evaluated with element-wise masks
+    instead of per-date or per-ticker loops. Tickers missing from closes are still
+    ranked; they just have NaN prices and returns (see price_coverage)."""
+
+    def __init__(self, history, closes):
+        self.tickers = pd.Index(pd.unique(history['Ticker'].astype(str)))
+        dates = pd.DatetimeIndex(np.unique(history['Date'].to_numpy()))
+        # Each snapshot trades at the first close on or after its date
+        rows = closes.index.searchsorted(dates)
+        keep = rows < len(closes.index)
+        self.dates, self.trade_rows = dates[keep], rows[keep]
+        self.prices = closes.reindex(columns=self.tickers).ffill().to_numpy(dtype=np.float32)
+        self.shape = (len(self.dates), len(self.tickers))
+        self._forward = {}
+
+        tickers = history['Ticker'].astype('category').array
+        r = self.dates.get_indexer(history['Date'])
+        c = self.tickers.get_indexer(tickers.categories.astype(str))[tickers.codes]
+        ok = (r >= 0) & (c >= 0) & (tickers.codes >= 0)
+        r, c = r[ok], c[ok]
+
+        self.columns = {}
+        for col in history.columns:
+            if col in ('Date', 'Ticker'):
+                continue
+            if col == 'Sector':
+                arr = np.full(self.shape, None, dtype=object)
+                arr[r, c] = history[col].astype(object).to_numpy()[ok]
+            else:
+                arr = np.full(self.shape, np.nan, dtype=np.float32)
+                arr[r, c] = history[col].to_numpy(dtype=np.float32, na_value=np.nan)[ok]
+            self.columns[col] = arr
+
+    def __getitem__(self, col):
+        return self.columns[col]
+
+    def forward_returns(self, horizon):
+        """(snapshot x ticker) return from each snapshot's trade close to the close
+        `horizon` trading days later (NaN past the end); computed once per horizon."""
+        if horizon not in self._forward:
+            prices = self.prices
+            fwd = np.full_like(prices, np.nan)
+            fwd[:-horizon] = prices[horizon:] / prices[:-horizon] - 1
+            self._forward[horizon] = fwd[self.trade_rows]
+        return self._forward[horizon]
+
+
+def pick_matrix(panel, filters_dict, order, top_n=TOP_N):
+    """Boolean (snapshot x ticker) matrix of the top_n tickers each snapshot passes,
+    ranked by the order's sort column (ascending, missing values never picked
+    ahead of present ones)."""
+    mask = filter_mask(panel, filters_dict, shape=panel.shape)
+    sort_column = SORT_COLUMNS.get(order)
+    if sort_column:
+        key = panel[sort_column].astype(np.float64)
+        key = np.where(np.isnan(key), np.finfo(np.float64).max, key)
+    else:
+        key = np.broadcast_to(np.arange(panel.shape[1], dtype=np.float64), panel.shape)
+    key = np.where(mask, key, np.inf)
+
+    picks = np.zeros(panel.shape, dtype=bool)
+    n = min(top_n, panel.shape[1])
+    if n == 0:
+        return picks
+    top = np.argpartition(key, n - 1, axis=1)[:, :n]
+    rows = np.arange(panel.shape[0])[:, None]
+    picks[rows, top] = np.isfinite(key[rows, top])
+    return picks
+
+def equity_curve(prices, picks, trade_rows, rebalance_days=REBALANCE_DAYS):
+    """Daily equity of an equal-weight basket rebuilt every rebalance_days from the
+    picks of the first snapshot in each rebalance window (picks without a price at
+    the trade close are left out). Returns (equity array, first traded row)."""
+    T, N = prices.shape
+    # The first snapshot in each rebalance bucket starts a holding period
+    bucket = (trade_rows - trade_rows[0]) // rebalance_days
+    starts = np.flatnonzero(np.r_[True, bucket[1:] != bucket[:-1]])
+    rows = trade_rows[starts]
+    baskets = picks[starts] & ~np.isnan(prices[rows])
+
+    weights = (baskets / np.maximum(baskets.sum(axis=1, keepdims=True), 1)).astype(np.float32)
+    held = np.searchsorted(rows, np.arange(T - 1), side='right') - 1   # basket held after each close
+    daily = np.nan_to_num(prices[1:] / prices[:-1] - 1)
+    w = np.where(held[:, None] >= 0, weights[np.maximum(held, 0)], 0)
+    port = np.zeros(T)
+    port[1:] = np.einsum('ij,ij->i', w, daily)
+    return np.cumprod(1 + port), rows[0]
+
+def backtest(panel, filters_dict, order, top_n=TOP_N, horizons=HORIZONS, rebalance_days=REBALANCE_DAYS):
+    """Forward returns, hit rates and drawdown for one filter set and sort order."""
+    picks = pick_matrix(panel, filters_dict, order, top_n)
+    result = {'Snapshots': len(picks), 'Avg Picks': float(picks.sum(axis=1).mean()) if len(picks) else 0.0}
+    if not picks.any():
+        return result
+    # Picks with a stored close on their trade date; the rest have NaN returns
+    priced = ~np.isnan(panel.prices[panel.trade_rows])
+    result['Priced Picks %'] = float((picks & priced).sum() / picks.sum() * 100)
+
+    for h in horizons:
+        fwd = panel.forward_returns(h)[picks]
+        fwd = fwd[~np.isnan(fwd)]
+        result[f"Fwd {h}d %"] = float(fwd.mean() * 100) if len(fwd) else np.nan
+        result[f"Hit Rate {h}d %"] = float((fwd > 0).mean() * 100) if len(fwd) else np.nan
+
+    equity, first = equity_curve(panel.prices, picks, panel.trade_rows, rebalance_days)
+    equity = equity[first:]
+    drawdown = equity / np.maximum.accumulate(equity) - 1
+    result['Total Return %'] = float((equity[-1] - 1) * 100)
+    result['Max Drawdown %'] = float(drawdown.min() * 100)
+    return result
+
+def sweep(history, closes, strategies=None, sorts=None, selections=None, **kwargs):
+    """backtest() for every strategy x sort order over one shared panel, one row each.
+    selections are the sidebar choices passed to build_filters, as for a scan."""
+    panel = SnapshotPanel(history, closes)
+    rows = []
+    for strategy in strategies or list(STRATEGIES):
+        filters_dict = build_filters(strategy, selections or {})
+        for sort_label in sorts or list(SORT_MAP):
+            rows.append({
+                'Strategy': strategy,
+                'Sort': sort_label,
+                **backtest(panel, filters_dict, SORT_MAP[sort_label], **kwargs),
+            })
+    return pd.DataFrame(rows)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline strategy backtest over stored universe snapshots and price history.")
+    parser.add_argument('--universe-dir', default=UNIVERSE_DIR)
+    parser.add_argument('--start')
+    parser.add_argument('--end')
+    parser.add_argument('--top-n', type=int, default=TOP_N)
+    parser.add_argument('--rebalance', type=int, default=REBALANCE_DAYS, help="trading days between rebalances")
+    parser.add_argument('--horizons', type=int, nargs='+', default=list(HORIZONS))
+    parser.add_argument('--output', help="also write the results table as CSV")
+    parser.add_argument('--backfill', action='store_true',
+                        help="first download missing price history for every snapshot ticker")
+    args = parser.parse_args(argv)
+
+    history = load_snapshot_history(args.universe_dir, args.start, args.end)
+    if history.empty:
+        raise SystemExit(f"No snapshots in {args.universe_dir}")
+    tickers = list(history['Ticker'].astype(str).unique())
+    if args.backfill:
+        print(f"Backfilled price history for {backfill(tickers)} of {len(tickers)} tickers")
+    closes = load_closes(tickers)
+    if closes.empty:
+        raise SystemExit("No stored price history for the snapshot tickers (run with --backfill)")
+
+    results = sweep(history, closes, top_n=args.top_n, horizons=tuple(args.horizons), rebalance_days=args.rebalance)
+    print(f"Price coverage: {price_coverage(tickers, closes) * 100:.0f}% of {len(tickers)} snapshot tickers")
+    print(results.to_string(index=False, float_format=lambda v: f"{v:.2f}"))
+    if args.output:
+        results.to_csv(args.output, index=False)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,295 @@
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+# --- BENCHMARK CONFIGURATION ---
+UNIVERSE_SIZES = [1000, 10000]
+SCAN_SIZES = [20, 200]
+PORTFOLIO_SIZES = [10, 200, 1000]
+ANALYST_SIZES = [2, 10]
+SENTIMENT_SIZES = [20, 200]
+BACKTEST_SIZES = [(252, 1000), (756, 5000)]  # (trading days, tickers)
+LOT_SIZES = [(1000, 200), (100000, 1000)]     # (lots, distinct tickers)
+ACCOUNT_NAMES = ["Taxable", "IRA", "Roth"]
+ALERT_SIZES = [(10000, 1000), (50000, 5000)]  # (rules, tickers)
+SECTOR_NAMES = ["Technology", "Energy", "Healthcare", "Financial", "Utilities"]
+HEADLINE_TEMPLATES = [
+    "{t} beats estimates as strong demand lifts revenue",
+    "{t} shares fall after weak guidance disappoints investors",
+    "Analysts upgrade {t} on improving margins",
+    "{t} faces lawsuit over accounting concerns",
+    "{t} announces record buyback and higher dividend",
+    "{t} cuts jobs amid slowing sales",
+    "Is {t} a good stock to buy now?",
+    "{t} unveils new product line at annual event",
+]
+
+
+def synthetic_tickers(n):
+    return [f"T{i:05d}" for i in range(n)]
+
+
+def generate_fixtures(provider, tickers, seed=0):
+    """Writes synthetic info/history fixtures for tickers and returns a matching universe frame."""
+    rng = np.random.default_rng(seed)
+    n = len(tickers)
+    dates = pd.bdate_range(end=pd.Timestamp.now().normalize(), periods=45)
+    prices = rng.uniform(5, 300, n)
+    sectors = rng.choice(SECTOR_NAMES, n)
+
+    for i, ticker in enumerate(tickers):
+        walk = prices[i] * np.cumprod(1 + rng.normal(0, 0.02, len(dates)))
+        provider.save('history', (ticker, "2mo"), pd.DataFrame({'Close': walk}, index=dates))
+        provider.save('info', (ticker,), {
+            'longName': f"{ticker} Corp",
+            'currentPrice': float(walk[-1]),
+            'fiftyTwoWeekHigh': float(walk.max() * rng.uniform(1.0, 1.5)),
+            'sector': str(sectors[i]),
+            'trailingPE': float(rng.uniform(5, 60)),
+            'priceToBook': float(rng.uniform(0.5, 8)),
+            'marketCap': float(rng.uniform(5e7, 5e11)),
+            'revenueGrowth': float(rng.normal(0.05, 0.1)),
+            'operatingMargins': float(rng.normal(0.12, 0.08)),
+            'totalDebt': float(rng.uniform(0, 5e9)),
+            'totalCash': float(rng.uniform(0, 5e9)),
+            'ebitda': float(rng.uniform(-1e8, 3e9)),
+            'enterpriseValue': float(rng.uniform(1e8, 5e11)),
+            'freeCashFlow': float(rng.uniform(-1e8, 2e9)),
+        })
+        provider.save('news', (ticker,), [
+            f"{HEADLINE_TEMPLATES[k].format(t=ticker)} ({j})"
+            for j, k in enumerate(rng.integers(0, len(HEADLINE_TEMPLATES), 20))
+        ])
+
+    return pd.DataFrame({
+        'Ticker': tickers,
+        'Company': [f"{t} Corp" for t in tickers],
+        'Sector': sectors,
+        'Market Cap': rng.uniform(5e7, 5e11, n),
+        'P/E': np.where(rng.random(n) < 0.2, np.nan, rng.uniform(1, 80, n)),
+        'P/B': rng.uniform(0.1, 10, n),
+        'Debt/Eq': rng.uniform(0, 2, n),
+        'Insider Trans': rng.normal(0, 0.1, n),
+        'RSI': rng.uniform(10, 90, n),
+        'Profit M': rng.normal(0.05, 0.1, n),
+        'Float Short': rng.uniform(0, 0.4, n),
+        'Change': rng.normal(0, 0.02, n),
+        'Perf Year': rng.normal(0, 0.3, n),
+        'Price': prices,
+    })
+
+
+def synthetic_snapshots(days, n, seed=0):
+    """(long snapshot history, closes) for a daily universe of n tickers."""
+    rng = np.random.default_rng(seed)
+    dates = pd.bdate_range(end=pd.Timestamp.now().normalize(), periods=days)
+    tickers = synthetic_tickers(n)
+    closes = pd.DataFrame(100 * np.cumprod(1 + rng.normal(0, 0.02, (days, n)), axis=0), index=dates, columns=tickers)
+    size = days * n
+    history = pd.DataFrame({
+        'Date': np.repeat(dates, n),
+        'Ticker': pd.Categorical(np.tile(tickers, days)),
+        'Sector': pd.Categorical(rng.choice(SECTOR_NAMES, size)),
+    })
+    for col, (lo, hi) in {
+        'Market Cap': (5e7, 5e11), 'P/E': (1, 80), 'P/B': (0.1, 10), 'Debt/Eq': (0, 2),
+        'Insider Trans': (-0.2, 0.2), 'RSI': (10, 90), 'Profit M': (-0.1, 0.2),
+        'Float Short': (0, 0.4), 'Change': (-0.05, 0.05), 'Perf Year': (-0.5, 0.5),
+    }.items():
+        history[col] = rng.uniform(lo, hi, size).astype('float32')
+    return history, closes
+
+
+def synthetic_lots(n, tickers, seed=0):
+    """Lots frame shaped like PortfolioStore.lots() for n buys spread over tickers."""
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        'Lot': np.arange(1, n + 1, dtype='int32'),
+        'Ticker': pd.Categorical(rng.choice(tickers, n)),
+        'Date Added': '2000-01-01',
+        'Price Added': rng.uniform(1, 500, n).astype('float32'),
+        'Quantity': rng.integers(1, 500, n).astype('float32'),
+        'Account': pd.Categorical(rng.choice(ACCOUNT_NAMES, n)),
+    })
+
+
+def time_case(fn, repeat, reset):
+    """Runs fn `repeat` times with reset() before each run; returns seconds per run."""
+    timings = []
+    for _ in range(repeat):
+        reset()
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def run_benchmarks(workdir, latency=0.05, repeat=3):
+    # Point every on-disk store at workdir before the app modules are imported
+    os.environ['STOCKPICKER_CACHE'] = os.path.join(workdir, 'cache.db')
+    os.environ['STOCKPICKER_UNIVERSE_DIR'] = os.path.join(workdir, 'universe')
+    os.environ['STOCKPICKER_HISTORY_DIR'] = os.path.join(workdir, 'history')
+
+    import market_data
+    from health import reset_breakers
+    from providers import FixtureProvider, set_provider
+    from sentiment import get_sentiment_store, ticker_sentiment
+    from backtest import sweep
+    from portfolio import positions, sector_exposure, value_lots
+    from alerts import METRICS as ALERT_METRICS, AlertEngine
+    from scanner import enrich_scan_rows, run_screen
+    from universe import UniverseSnapshot, SORT_MAP, build_filters
+
+    provider = FixtureProvider(os.path.join(workdir, 'fixtures'), mode='replay', latency=latency)
+    set_provider(provider)
+
+    all_tickers = synthetic_tickers(max(UNIVERSE_SIZES + PORTFOLIO_SIZES + ANALYST_SIZES))
+    universe_df = generate_fixtures(provider, all_tickers)
+
+    def reset():
+        market_data.CACHE.clear()
+        market_data.HISTORY.clear()
+        reset_breakers()
+
+    results = {}
+
+    # 1. Scan: local screen over the universe + enrichment of the top rows
+    strategy = "Custom (Manual)"
+    filters_dict = build_filters(strategy, {})
+    order = SORT_MAP["Lowest P/E (Cheapest Earnings)"]
+    for size in UNIVERSE_SIZES:
+        universe = UniverseSnapshot(directory=os.path.join(workdir, 'universe', str(size)))
+        os.makedirs(universe.directory, exist_ok=True)
+        universe_df.head(size).to_parquet(os.path.join(universe.directory, '2000-01-01.parquet'), index=False)
+        for rows in SCAN_SIZES:
+            def scan():
+                df = run_screen(filters_dict, order=order, source='snapshot', universe=universe)
+                enrich_scan_rows(df.head(rows), rate=1000)
+            results[f"scan[universe={size},rows={rows}]"] = time_case(scan, repeat, reset)
+
+    # 2. Portfolio refresh: bulk performance for every holding
+    for size in PORTFOLIO_SIZES:
+        tickers = all_tickers[:size]
+        results[f"portfolio[holdings={size}]"] = time_case(
+            lambda: market_data.get_performance_bulk(tickers), repeat, reset)
+    # Warm refresh: history already stored locally, nothing is downloaded
+    tickers = all_tickers[:max(PORTFOLIO_SIZES)]
+    market_data.get_performance_bulk(tickers)
+    results[f"portfolio_warm[holdings={len(tickers)}]"] = time_case(
+        lambda: market_data.get_performance_bulk(tickers), repeat, lambda: None)
+
+    # 3. Analyst comparison: fundamentals for every compared ticker
+    for size in ANALYST_SIZES:
+        tickers = all_tickers[:size]
+        results[f"analyst[tickers={size}]"] = time_case(
+            lambda: market_data.get_stock_data_many(tickers), repeat, reset)
+
+    # 4. News sentiment: headlines fetched and scored, none cached beforehand
+    def reset_sentiment():
+        reset()
+        get_sentiment_store().clear()
+
+    for size in SENTIMENT_SIZES:
+        tickers = all_tickers[:size]
+        results[f"sentiment[tickers={size}]"] = time_case(
+            lambda: ticker_sentiment(tickers), repeat, reset_sentiment)
+
+    # 5. Backtest: every strategy x sort order over daily snapshots (no I/O)
+    for days, size in BACKTEST_SIZES:
+        history, closes = synthetic_snapshots(days, size)
+        results[f"backtest[days={days},tickers={size}]"] = time_case(
+            lambda: sweep(history, closes), repeat, lambda: None)
+
+    # 6. Lot valuation: P&L, positions and sector exposure over the whole book (no I/O)
+    for n, size in LOT_SIZES:
+        tickers = all_tickers[:size]
+        lots = synthetic_lots(n, tickers)
+        prices = pd.Series(np.linspace(1, 500, size), index=tickers)
+        sectors = pd.Series(np.resize(SECTOR_NAMES, size), index=tickers)
+
+        def valuation():
+            valued = value_lots(lots, prices)
+            positions(valued)
+            sector_exposure(valued, sectors)
+        results[f"valuation[lots={n},tickers={size}]"] = time_case(valuation, repeat, lambda: None)
+
+    # 7. Outage: every Yahoo call fails after the usual latency; the circuit breaker
+    # should turn a scan into fast failures instead of one timeout per row
+    for rows in SCAN_SIZES:
+        universe = UniverseSnapshot(directory=os.path.join(workdir, 'universe', str(UNIVERSE_SIZES[0])))
+        df = run_screen(filters_dict, order=order, source='snapshot', universe=universe).head(rows)
+        provider.error_rate = 1.0
+        results[f"scan_outage[rows={rows}]"] = time_case(lambda: enrich_scan_rows(df, rate=1000), repeat, reset)
+        provider.error_rate = 0.0
+    reset()
+
+    # 8. Alert ticks: one new price for every ticker, each touching only its own rules
+    rng = np.random.default_rng(0)
+    metrics = list(ALERT_METRICS)
+    for n, size in ALERT_SIZES:
+        tickers = synthetic_tickers(size)
+        engine = AlertEngine(os.path.join(workdir, f'alerts-{n}.db'))
+        engine.add_rules([
+            (tickers[i % size], metrics[i % len(metrics)], '<' if i % 2 else '>', float(rng.uniform(-20, 20)))
+            for i in range(n)
+        ])
+        engine.update(pd.DataFrame({'cost': 50.0, 'high_52': 110.0, 'pe': 20.0, 'sector_pe': 22.0}, index=tickers))
+        prices = rng.uniform(1, 100, size)
+
+        def ticks():
+            for ticker, price in zip(tickers, prices):
+                engine.tick(ticker, price=price)
+            prices[:] = prices[::-1]
+        results[f"alert_ticks[rules={n},tickers={size}]"] = time_case(ticks, repeat, lambda: None)
+
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline benchmarks for the scan, portfolio and analyst hot paths.")
+    parser.add_argument('--latency', type=float, default=0.05, help="synthetic seconds per upstream call")
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--json', help="write median timings to this file")
+    parser.add_argument('--baseline', help="compare against a previous --json file")
+    parser.add_argument('--tolerance', type=float, default=0.25, help="allowed slowdown vs baseline (0.25 = 25%%)")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as workdir:
+        results = run_benchmarks(workdir, latency=args.latency, repeat=args.repeat)
+
+    medians = {name: statistics.median(t) for name, t in results.items()}
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    regressions = []
+    print(f"{'case':<36}{'min (s)':>10}{'median (s)':>12}{'baseline':>10}")
+    for name, timings in results.items():
+        base = baseline.get(name)
+        flag = ""
+        if base and medians[name] > base * (1 + args.tolerance):
+            regressions.append(name)
+            flag = "  REGRESSION"
+        base_str = f"{base:.3f}" if base else "-"
+        print(f"{name:<36}{min(timings):>10.3f}{medians[name]:>12.3f}{base_str:>10}{flag}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(medians, f, indent=2)
+
+    if regressions:
+        print(f"{len(regressions)} case(s) slower than baseline", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
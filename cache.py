@@ -0,0 +1,210 @@
+import os
+import pickle
+import sqlite3
+import threading
+import time
+import hashlib
+
+# --- CACHE CONFIGURATION ---
+CACHE_PATH = os.environ.get('STOCKPICKER_CACHE', 'market_cache.db')
+MAX_ENTRIES = 5000
+STALE_SECONDS = 7 * 24 * 60 * 60  # how old an expired entry may be and still stand in for a failed fetch
+
+# Seconds each kind of response stays fresh
+DEFAULT_TTLS = {
+    'quote': 30,              # fast_info last price
+    'history': 15 * 60,       # daily price history
+    'info': 6 * 60 * 60,      # fundamentals (stock.info)
+    'screener': 15 * 60,      # Finviz screener_view
+    'news': 30 * 60,          # headline lists
+}
+
+
+class SingleFlight:
+    """Coalesces concurrent calls with the same key into one execution; the other
+    callers wait for it and share its result (or its exception)."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = {}
+        self.coalesced = 0
+
+    def do(self, key, fn):
+        with self.lock:
+            call = self.calls.get(key)
+            leader = call is None
+            if leader:
+                call = self.calls[key] = {'done': threading.Event(), 'result': None, 'error': None}
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            call['done'].wait()
+            if call['error'] is not None:
+                raise call['error']
+            return call['result']
+
+        try:
+            call['result'] = fn()
+            return call['result']
+        except BaseException as e:
+            call['error'] = e
+            raise
+        finally:
+            with self.lock:
+                del self.calls[key]
+            call['done'].set()
+
+
+class DiskCache:
+    """SQLite-backed TTL cache with LRU eviction, shared by every session and process."""
+
+    def __init__(self, path=CACHE_PATH, max_entries=MAX_ENTRIES, ttls=None):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttls = dict(DEFAULT_TTLS)
+        if ttls: self.ttls.update(ttls)
+        self.hits = {}
+        self.misses = {}
+        self.lock = threading.Lock()
+        self.flight = SingleFlight()
+        self.stale = {}  # key -> created time, for entries currently served past their TTL
+        self.stale_served = 0
+
+        self.conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS cache (
+                key TEXT PRIMARY KEY,
+                kind TEXT NOT NULL,
+                value BLOB NOT NULL,
+                created REAL NOT NULL,
+                accessed REAL NOT NULL
+            )
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_cache_accessed ON cache(accessed)")
+        self.conn.commit()
+
+    @staticmethod
+    def make_key(kind, args):
+        digest = hashlib.sha1(repr(args).encode('utf-8')).hexdigest()
+        return f"{kind}:{digest}"
+
+    def _lookup(self, kind, key):
+        """(hit, value) without touching the hit/miss counters. Caller holds self.lock."""
+        now = time.time()
+        row = self.conn.execute("SELECT value, created FROM cache WHERE key = ?", (key,)).fetchone()
+        if row and now - row[1] <= self.ttls.get(kind, 0):
+            self.conn.execute("UPDATE cache SET accessed = ? WHERE key = ?", (now, key))
+            self.conn.commit()
+            self.stale.pop(key, None)
+            return True, pickle.loads(row[0])
+        return False, None
+
+    def _lookup_stale(self, key):
+        """(found, value, created) ignoring the TTL, within STALE_SECONDS. Caller holds self.lock."""
+        row = self.conn.execute("SELECT value, created FROM cache WHERE key = ?", (key,)).fetchone()
+        if row and time.time() - row[1] <= STALE_SECONDS:
+            return True, pickle.loads(row[0]), row[1]
+        return False, None, None
+
+    def get(self, kind, args):
+        """Returns (hit, value). Expired entries count as misses."""
+        key = self.make_key(kind, args)
+        with self.lock:
+            hit, value = self._lookup(kind, key)
+            counter = self.hits if hit else self.misses
+            counter[kind] = counter.get(kind, 0) + 1
+        return hit, value
+
+    def set(self, kind, args, value):
+        key = self.make_key(kind, args)
+        now = time.time()
+        blob = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO cache (key, kind, value, created, accessed) VALUES (?, ?, ?, ?, ?)",
+                (key, kind, blob, now, now)
+            )
+            self._evict()
+            self.conn.commit()
+            self.stale.pop(key, None)
+
+    def get_or_fetch(self, kind, args, fetch):
+        """Returns the cached value or calls fetch() and stores it. Concurrent misses for
+        the same key share a single fetch. Exceptions are not cached: when fetch()
+        fails, an expired entry (see is_stale) is returned instead if there is one,
+        otherwise the exception propagates."""
+        hit, value = self.get(kind, args)
+        if hit:
+            return value
+
+        key = self.make_key(kind, args)
+        def load():
+            # A flight that finished just before this one started may have filled the entry
+            with self.lock:
+                hit, value = self._lookup(kind, key)
+            if hit:
+                return value
+            try:
+                value = fetch()
+            except Exception:
+                with self.lock:
+                    found, value, created = self._lookup_stale(key)
+                    if not found:
+                        raise
+                    self.stale[key] = created
+                    self.stale_served += 1
+                return value
+            self.set(kind, args, value)
+            return value
+        return self.flight.do(key, load)
+
+    def is_stale(self, kind, args):
+        """True while the entry is being served past its TTL because refreshing it failed."""
+        with self.lock:
+            return self.make_key(kind, args) in self.stale
+
+    def _evict(self):
+        count = self.conn.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+        if count > self.max_entries:
+            self.conn.execute(
+                "DELETE FROM cache WHERE key IN (SELECT key FROM cache ORDER BY accessed ASC LIMIT ?)",
+                (count - self.max_entries,)
+            )
+
+    def stats(self):
+        """Hit/miss counters per kind plus the current entry count."""
+        with self.lock:
+            entries = self.conn.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+        kinds = sorted(set(self.hits) | set(self.misses))
+        return {
+            'entries': entries,
+            'hits': sum(self.hits.values()),
+            'misses': sum(self.misses.values()),
+            'coalesced': self.flight.coalesced,
+            'stale': self.stale_served,
+            'by_kind': {k: {'hits': self.hits.get(k, 0), 'misses': self.misses.get(k, 0)} for k in kinds}
+        }
+
+    def clear(self, kind=None):
+        with self.lock:
+            if kind:
+                self.conn.execute("DELETE FROM cache WHERE kind = ?", (kind,))
+            else:
+                self.conn.execute("DELETE FROM cache")
+            self.conn.commit()
+            self.stale.clear()
+
+
+_default_cache = None
+_default_lock = threading.Lock()
+
+def get_cache():
+    """Process-wide DiskCache instance."""
+    global _default_cache
+    with _default_lock:
+        if _default_cache is None:
+            _default_cache = DiskCache()
+        return _default_cache
@@ -0,0 +1,204 @@
+import os
+import threading
+import time
+
+from metrics import count_error
+
+# --- CIRCUIT BREAKER CONFIGURATION ---
+FAILURE_THRESHOLD = int(os.environ.get('STOCKPICKER_BREAKER_THRESHOLD', '5'))  # consecutive failures that open a circuit
+OPEN_SECONDS = float(os.environ.get('STOCKPICKER_BREAKER_OPEN_SECONDS', '30'))  # first wait before probing; doubles per failed probe
+MAX_OPEN_SECONDS = 5 * 60
+SLOW_CALL_SECONDS = 15.0       # a call that takes longer counts as a failure (it was a timeout in all but name)
+NO_SLOW_LIMIT = float('inf')   # slow_seconds for bulk calls that are slow by design (full-market screens)
+UPSTREAMS = ('yahoo', 'finviz')
+
+CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half_open'
+
+
+class UpstreamUnavailable(Exception):
+    """Raised instead of calling an upstream whose circuit is open."""
+
+    def __init__(self, upstream, retry_in=None, last_error=None):
+        self.upstream = upstream
+        self.retry_in = retry_in
+        self.last_error = last_error
+        msg = f"{upstream} is unavailable"
+        if retry_in is not None:
+            msg += f" (retrying in {retry_in:.0f}s)"
+        if last_error:
+            msg += f": {last_error}"
+        super().__init__(msg)
+
+
+# Exception class names (anywhere in the MRO) that mean the upstream could not be
+# reached or refused to serve: builtin / requests / curl_cffi connection errors and
+# timeouts, and yfinance's rate-limit error
+FAILURE_TYPES = {'ConnectionError', 'TimeoutError', 'Timeout', 'YFRateLimitError'}
+
+
+def is_upstream_failure(exc):
+    """Connection errors, timeouts, HTTP 429 and 5xx count against an upstream. Other
+    HTTP errors (an unknown ticker's 404) and data errors mean it answered, so they
+    do not."""
+    status = getattr(getattr(exc, 'response', None), 'status_code', None)
+    if status is not None:
+        return status == 429 or status >= 500
+    return any(cls.__name__ in FAILURE_TYPES for cls in type(exc).__mro__)
+
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker for one upstream.
+
+    closed: calls go through. After `threshold` failures in a row it opens, and calls
+    raise UpstreamUnavailable at once. A background thread waits out the cool-down,
+    then (half-open) calls `probe`, a request known to succeed when the upstream is
+    healthy: success closes the circuit, failure reopens it with the cool-down
+    doubled. Without a probe the circuit closes one failure short of reopening, so
+    the next real call decides."""
+
+    def __init__(self, name, threshold=FAILURE_THRESHOLD, open_seconds=OPEN_SECONDS,
+                 max_open_seconds=MAX_OPEN_SECONDS, slow_seconds=SLOW_CALL_SECONDS, probe=None):
+        self.name = name
+        self.threshold = threshold
+        self.open_seconds = open_seconds
+        self.max_open_seconds = max_open_seconds
+        self.slow_seconds = slow_seconds
+        self.probe = probe
+        self.lock = threading.Lock()
+        self.prober = None
+        self._reset()
+
+    def _reset(self):
+        self.state = CLOSED
+        self.failures = 0
+        self.cooldown = self.open_seconds
+        self.retry_at = 0.0
+        self.opened_at = None
+        self.last_error = None
+        self.calls = 0
+        self.rejected = 0
+
+    def reset(self):
+        """Back to closed with clean counters (tests, benchmarks)."""
+        with self.lock:
+            self._reset()
+
+    def is_available(self):
+        return self.state == CLOSED
+
+    def retry_in(self):
+        return max(0.0, self.retry_at - time.monotonic()) if self.state != CLOSED else None
+
+    def call(self, fn, slow_seconds=None):
+        """fn() guarded by the circuit. slow_seconds overrides the breaker's slow-call
+        limit for this call (NO_SLOW_LIMIT leaves timeouts to the transport)."""
+        with self.lock:
+            if self.state != CLOSED:
+                self.rejected += 1
+                raise UpstreamUnavailable(self.name, self.retry_in(), self.last_error)
+            self.calls += 1
+
+        limit = self.slow_seconds if slow_seconds is None else slow_seconds
+        start = time.monotonic()
+        try:
+            result = fn()
+        except Exception as e:
+            if is_upstream_failure(e):
+                self.record_failure(e)
+            else:
+                self.record_success()
+            raise
+        if time.monotonic() - start > limit:
+            self.record_failure(TimeoutError(f"call took {time.monotonic() - start:.1f}s"))
+        else:
+            self.record_success()
+        return result
+
+    def record_success(self):
+        with self.lock:
+            if self.state == CLOSED:
+                self.failures = 0
+
+    def record_failure(self, exc):
+        with self.lock:
+            self.failures += 1
+            self.last_error = f"{type(exc).__name__}: {exc}"[:200]
+            if self.state == CLOSED and self.failures >= self.threshold:
+                self._open()
+                count_error(f"circuit.{self.name}", exc)
+
+    def _open(self):
+        # caller holds self.lock
+        self.state = OPEN
+        self.opened_at = self.opened_at or time.time()
+        self.retry_at = time.monotonic() + self.cooldown
+        if self.prober is None or not self.prober.is_alive():
+            self.prober = threading.Thread(target=self._probe_loop, name=f"probe-{self.name}", daemon=True)
+            self.prober.start()
+
+    def _close(self):
+        # caller holds self.lock
+        self.state = CLOSED
+        self.failures = 0
+        self.cooldown = self.open_seconds
+        self.opened_at = None
+
+    def _probe_loop(self):
+        while True:
+            with self.lock:
+                if self.state == CLOSED:
+                    return
+                wait = self.retry_at - time.monotonic()
+                if wait <= 0:
+                    self.state = HALF_OPEN
+                    probe = self.probe
+                    if probe is None:
+                        self._close()
+                        self.failures = self.threshold - 1
+                        return
+            if wait > 0:
+                time.sleep(min(wait, 1.0))
+                continue
+
+            try:
+                probe()
+                ok = True
+            except Exception as e:
+                ok = not is_upstream_failure(e)
+                error = e
+
+            with self.lock:
+                if ok:
+                    self._close()
+                    return
+                self.last_error = f"{type(error).__name__}: {error}"[:200]
+                self.cooldown = min(self.cooldown * 2, self.max_open_seconds)
+                self.state = OPEN
+                self.retry_at = time.monotonic() + self.cooldown
+
+    def status(self):
+        with self.lock:
+            return {
+                'upstream': self.name,
+                'state': self.state,
+                'failures': self.failures,
+                'retry_in': self.retry_in(),
+                'open_since': self.opened_at,
+                'last_error': self.last_error,
+                'calls': self.calls,
+                'rejected': self.rejected,
+            }
+
+
+BREAKERS = {name: CircuitBreaker(name) for name in UPSTREAMS}
+
+def get_breaker(upstream):
+    return BREAKERS[upstream]
+
+def health_snapshot():
+    """status() of every upstream's breaker."""
+    return [b.status() for b in BREAKERS.values()]
+
+def reset_breakers():
+    for breaker in BREAKERS.values():
+        breaker.reset()
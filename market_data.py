@@ -0,0 +1,225 @@
+import asyncio
+import math
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+from cache import SingleFlight, get_cache
+from metrics import count_error
+from price_history import get_history_store
+from providers import get_provider
+
+CACHE = get_cache()
+HISTORY = get_history_store()
+PERFORMANCE_FLIGHT = SingleFlight()
+
+# --- RAW FETCHES (cached) ---
+
+def fetch_info(ticker):
+    return CACHE.get_or_fetch('info', (ticker,), lambda: get_provider().info(ticker))
+
+def fetch_last_price(ticker):
+    return CACHE.get_or_fetch('quote', (ticker,), lambda: get_provider().last_price(ticker))
+
+def fetch_history(ticker, period="2mo"):
+    return CACHE.get_or_fetch('history', (ticker, period), lambda: get_provider().history(ticker, period))
+
+def fetch_news(ticker):
+    return CACHE.get_or_fetch('news', (ticker,), lambda: get_provider().news(ticker))
+
+def fetch_screener(filters_dict=None, order='Ticker'):
+    """Runs a Finviz Valuation screen, cached by filters and sort order."""
+    key = (tuple(sorted((filters_dict or {}).items())), order)
+    return CACHE.get_or_fetch('screener', key, lambda: get_provider().screener(filters_dict, order))
+
+# --- CONCURRENT FETCHES ---
+
+# Blocking fetches run here rather than in asyncio's default executor, which is
+# sized by CPU count and would cap concurrency below the per-host limits
+FETCH_POOL = ThreadPoolExecutor(max_workers=32, thread_name_prefix="fetch")
+
+FETCHERS = {
+    'info': fetch_info,
+    'quote': fetch_last_price,
+    'history': fetch_history,
+    'news': fetch_news,
+}
+
+async def fetch_many(tickers, fields=('info',), concurrency=16):
+    """Fetches every field for every ticker concurrently (cached, coalesced, and
+    limited per host by the shared transport). Returns {ticker: {field: value}},
+    with None where a fetch failed."""
+    tickers = list(dict.fromkeys(tickers))
+    gate = asyncio.Semaphore(concurrency)
+    loop = asyncio.get_running_loop()
+
+    async def one(ticker, field):
+        async with gate:
+            try:
+                return await loop.run_in_executor(FETCH_POOL, FETCHERS[field], ticker)
+            except Exception as e:
+                count_error(f"fetch_many.{field}", e)
+                return None
+
+    jobs = [(t, f) for t in tickers for f in fields]
+    values = await asyncio.gather(*(one(t, f) for t, f in jobs))
+    results = {t: {} for t in tickers}
+    for (t, f), value in zip(jobs, values):
+        results[t][f] = value
+    return results
+
+def fetch_many_blocking(tickers, fields=('info',), concurrency=16):
+    """fetch_many for synchronous callers (Streamlit pages, worker threads)."""
+    return asyncio.run(fetch_many(tickers, fields, concurrency))
+
+# --- DERIVED DATA ---
+
+def get_performance_data(ticker):
+    """(current price, 1-week %, 1-month %); NaN for whatever could not be fetched."""
+    current_price = math.nan
+    change_1w = math.nan
+    change_1m = math.nan
+    
+    try:
+        current_price = fetch_last_price(ticker)
+        
+        hist = HISTORY.history(ticker)
+        if not hist.empty:
+            week_ago = datetime.now() - timedelta(days=7)
+            week_idx = hist.index.get_indexer([week_ago], method='nearest')[0]
+            price_1w = hist['Close'].iloc[week_idx]
+            
+            month_ago = datetime.now() - timedelta(days=30)
+            month_idx = hist.index.get_indexer([month_ago], method='nearest')[0]
+            price_1m = hist['Close'].iloc[month_idx]
+
+            if price_1w > 0:
+                change_1w = ((current_price - price_1w) / price_1w) * 100
+            if price_1m > 0:
+                change_1m = ((current_price - price_1m) / price_1m) * 100
+    except Exception as e:
+        count_error('get_performance_data', e)
+        
+    return current_price, change_1w, change_1m
+
+def get_performance_bulk(tickers):
+    """Current price, 1-week % and 1-month % for many tickers from the local history store
+    (NaN without data; Stale marks tickers whose refresh failed, so their stored bars
+    are older than the refresh window). Sessions asking for the same tickers at the
+    same time share one computation."""
+    tickers = sorted(set(tickers))
+    return PERFORMANCE_FLIGHT.do(tuple(tickers), lambda: _performance_bulk(tickers)).copy()
+
+def _performance_bulk(tickers):
+    perf = pd.DataFrame(math.nan, index=tickers, columns=['Current Price', '1 Week %', '1 Month %'])
+    perf['Stale'] = False
+    if not tickers:
+        return perf
+
+    try:
+        # Local store: only the days since each ticker's last stored bar are downloaded
+        closes = HISTORY.closes(tickers).ffill()
+        if closes.empty:
+            return perf
+
+        now = pd.Timestamp.now()
+        # Every ticker shares the same date index, so each look-back is one lookup
+        week_idx, month_idx = closes.index.get_indexer(
+            [now - timedelta(days=7), now - timedelta(days=30)], method='nearest'
+        )
+        current = closes.iloc[-1]
+        price_1w = closes.iloc[week_idx]
+        price_1m = closes.iloc[month_idx]
+
+        perf['Current Price'] = current
+        perf['1 Week %'] = ((current - price_1w) / price_1w * 100).where(price_1w > 0)
+        perf['1 Month %'] = ((current - price_1m) / price_1m * 100).where(price_1m > 0)
+        # Still due for a download right after update() means the download failed
+        perf['Stale'] = [HISTORY.needed_period(t) is not None for t in tickers]
+        perf['Stale'] &= perf['Current Price'].notna()
+    except Exception as e:
+        count_error('get_performance_bulk', e)
+
+    return perf
+
+def get_stock_data_safe(ticker):
+    """Fetches comprehensive stock info safely. 'stale' is True when the info is an
+    expired cache entry served because Yahoo could not be reached."""
+    try:
+        info = fetch_info(ticker)
+        
+        name = info.get('longName', info.get('shortName', ticker))
+        
+        # --- CALCULATE ADVANCED METRICS ---
+        
+        # 1. Net Debt / EBITDA
+        total_debt = info.get('totalDebt', 0)
+        total_cash = info.get('totalCash', 0)
+        ebitda = info.get('ebitda', 0)
+        
+        if ebitda and ebitda > 0:
+            net_debt = total_debt - total_cash
+            debt_ebitda = net_debt / ebitda
+        else:
+            debt_ebitda = math.nan # N/A (EBITDA <= 0): missing, so it scores 0 instead of best
+            
+        # 2. EV / FCF
+        ev = info.get('enterpriseValue', 0)
+        fcf = info.get('freeCashFlow', 0)
+        
+        if fcf and fcf > 0:
+            ev_fcf = ev / fcf
+        else:
+            ev_fcf = 0 # N/A or Negative Cash Flow
+            
+        data = {
+            'ticker': ticker,
+            'name': name,
+            'price': info.get('currentPrice', 0),
+            'sector': info.get('sector', 'Unknown'),
+            'pe': info.get('trailingPE', 0),
+            'pb': info.get('priceToBook', 0),
+            'mc': info.get('marketCap', 0),
+            # NEW METRICS
+            'revenue_growth': info.get('revenueGrowth', 0), # Percentage
+            'operating_margin': info.get('operatingMargins', 0), # Percentage
+            'debt_ebitda': debt_ebitda,
+            'ev_fcf': ev_fcf,
+            'stale': CACHE.is_stale('info', (ticker,))
+        }
+        
+        # Clean Nones
+        for k, v in data.items():
+            if v is None: data[k] = 0
+            
+        return data
+    except Exception as e:
+        count_error('get_stock_data_safe', e)
+        return None
+
+def get_stock_data_many(tickers, concurrency=16):
+    """get_stock_data_safe for many tickers, with every info fetched concurrently first.
+    Returns (DataFrame in input order, list of tickers that could not be found)."""
+    tickers = list(dict.fromkeys(tickers))
+    infos = fetch_many_blocking(tickers, ('info',), concurrency)
+    # Failed fetches are not retried here; get_stock_data_safe reads the rest from the cache
+    results = [get_stock_data_safe(t) if infos[t]['info'] is not None else None for t in tickers]
+    rows = [r for r in results if r]
+    missing = [t for t, r in zip(tickers, results) if not r]
+    return pd.DataFrame(rows), missing
+
+def get_sectors(tickers, snapshot=None):
+    """Sector per ticker: from the universe snapshot frame when it lists the ticker,
+    otherwise from its (cached, concurrently fetched) info. Unknown ones are ''."""
+    tickers = list(dict.fromkeys(tickers))
+    sectors = pd.Series('', index=tickers, dtype=object)
+    if snapshot is not None and 'Sector' in snapshot.columns:
+        known = snapshot.drop_duplicates('Ticker').set_index('Ticker')['Sector']
+        sectors.update(known.reindex(tickers).dropna())
+    missing = list(sectors.index[sectors == ''])
+    if missing:
+        infos = fetch_many_blocking(missing, ('info',))
+        for t in missing:
+            sectors[t] = (infos[t]['info'] or {}).get('sector') or ''
+    return sectors
@@ -0,0 +1,193 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# --- METRICS CONFIGURATION ---
+METRICS_PORT = os.environ.get('STOCKPICKER_METRICS_PORT')  # serve /metrics when set
+
+# Histogram bucket upper bounds in seconds
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class Histogram:
+    """Fixed-bucket latency histogram (Prometheus layout, non-cumulative counts)."""
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)  # last slot is +Inf
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds):
+        i = 0
+        while i < len(BUCKETS) and seconds > BUCKETS[i]:
+            i += 1
+        self.counts[i] += 1
+        self.count += 1
+        self.sum += seconds
+        self.max = max(self.max, seconds)
+
+    def quantile(self, q):
+        """Approximate quantile by interpolating inside the matching bucket."""
+        if not self.count:
+            return 0.0
+        target = q * self.count
+        seen = 0
+        lower = 0.0
+        for i, c in enumerate(self.counts):
+            upper = BUCKETS[i] if i < len(BUCKETS) else self.max
+            if c and seen + c >= target:
+                return min(lower + (upper - lower) * (target - seen) / c, self.max)
+            seen += c
+            lower = upper
+        return self.max
+
+
+class MetricsRegistry:
+    """Process-wide call latencies and error counts."""
+
+    def __init__(self):
+        self.histograms = {}
+        self.errors = {}
+        self.last_errors = {}
+        self.started = time.time()
+        self.lock = threading.Lock()
+
+    def observe(self, name, seconds):
+        with self.lock:
+            hist = self.histograms.get(name)
+            if hist is None:
+                hist = self.histograms[name] = Histogram()
+            hist.observe(seconds)
+
+    def count_error(self, name, exc=None):
+        with self.lock:
+            self.errors[name] = self.errors.get(name, 0) + 1
+            if exc is not None:
+                self.last_errors[name] = f"{type(exc).__name__}: {exc}"[:200]
+
+    @contextmanager
+    def timed(self, name):
+        """Times the block under `name`; an exception counts as an error for `name` and is re-raised."""
+        start = time.perf_counter()
+        try:
+            yield
+        except Exception as e:
+            self.count_error(name, e)
+            raise
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    def reset(self):
+        with self.lock:
+            self.histograms.clear()
+            self.errors.clear()
+            self.last_errors.clear()
+            self.started = time.time()
+
+    def snapshot(self, cache_stats=None, upstreams=None):
+        """Plain-dict view of everything recorded (plus cache counters and upstream
+        health when given)."""
+        with self.lock:
+            calls = {
+                name: {
+                    'count': h.count,
+                    'mean_ms': (h.sum / h.count * 1000) if h.count else 0.0,
+                    'p50_ms': h.quantile(0.50) * 1000,
+                    'p95_ms': h.quantile(0.95) * 1000,
+                    'max_ms': h.max * 1000,
+                    'errors': self.errors.get(name, 0),
+                    'buckets': dict(zip([str(b) for b in BUCKETS] + ['+Inf'], h.counts)),
+                }
+                for name, h in sorted(self.histograms.items())
+            }
+            data = {
+                'since': self.started,
+                'calls': calls,
+                'errors': dict(sorted(self.errors.items())),
+                'last_errors': dict(self.last_errors),
+            }
+        if cache_stats is not None:
+            data['cache'] = cache_stats
+        if upstreams is not None:
+            data['upstreams'] = upstreams
+        return data
+
+    def to_json(self, cache_stats=None, upstreams=None):
+        return json.dumps(self.snapshot(cache_stats, upstreams), indent=2)
+
+    def to_prometheus(self, cache_stats=None, upstreams=None):
+        """Prometheus text exposition format."""
+        lines = ["# TYPE stockpicker_call_seconds histogram"]
+        with self.lock:
+            for name, h in sorted(self.histograms.items()):
+                cumulative = 0
+                for bound, c in zip(list(BUCKETS) + ['+Inf'], h.counts):
+                    cumulative += c
+                    lines.append(f'stockpicker_call_seconds_bucket{{call="{name}",le="{bound}"}} {cumulative}')
+                lines.append(f'stockpicker_call_seconds_sum{{call="{name}"}} {h.sum:.6f}')
+                lines.append(f'stockpicker_call_seconds_count{{call="{name}"}} {h.count}')
+            lines.append("# TYPE stockpicker_errors_total counter")
+            for name, n in sorted(self.errors.items()):
+                lines.append(f'stockpicker_errors_total{{source="{name}"}} {n}')
+        if cache_stats is not None:
+            lines.append("# TYPE stockpicker_cache_hits_total counter")
+            for kind, c in cache_stats.get('by_kind', {}).items():
+                lines.append(f'stockpicker_cache_hits_total{{kind="{kind}"}} {c["hits"]}')
+            lines.append("# TYPE stockpicker_cache_misses_total counter")
+            for kind, c in cache_stats.get('by_kind', {}).items():
+                lines.append(f'stockpicker_cache_misses_total{{kind="{kind}"}} {c["misses"]}')
+            lines.append("# TYPE stockpicker_cache_coalesced_total counter")
+            lines.append(f"stockpicker_cache_coalesced_total {cache_stats.get('coalesced', 0)}")
+            lines.append("# TYPE stockpicker_cache_stale_total counter")
+            lines.append(f"stockpicker_cache_stale_total {cache_stats.get('stale', 0)}")
+            lines.append("# TYPE stockpicker_cache_entries gauge")
+            lines.append(f"stockpicker_cache_entries {cache_stats.get('entries', 0)}")
+        if upstreams is not None:
+            lines.append("# TYPE stockpicker_upstream_up gauge")
+            for u in upstreams:
+                lines.append(f'stockpicker_upstream_up{{upstream="{u["upstream"]}"}} {int(u["state"] == "closed")}')
+            lines.append("# TYPE stockpicker_upstream_rejected_total counter")
+            for u in upstreams:
+                lines.append(f'stockpicker_upstream_rejected_total{{upstream="{u["upstream"]}"}} {u["rejected"]}')
+        return "\n".join(lines) + "\n"
+
+
+METRICS = MetricsRegistry()
+
+def timed(name):
+    return METRICS.timed(name)
+
+def count_error(name, exc=None):
+    METRICS.count_error(name, exc)
+
+
+def start_metrics_server(port, cache_stats_fn=None, health_fn=None):
+    """Serves /metrics (Prometheus) and /metrics.json from a daemon thread."""
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            stats = cache_stats_fn() if cache_stats_fn else None
+            upstreams = health_fn() if health_fn else None
+            if self.path == '/metrics':
+                body, ctype = METRICS.to_prometheus(stats, upstreams), 'text/plain; version=0.0.4'
+            elif self.path == '/metrics.json':
+                body, ctype = METRICS.to_json(stats, upstreams), 'application/json'
+            else:
+                self.send_error(404)
+                return
+            payload = body.encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', ctype)
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('0.0.0.0', int(port)), Handler)
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    return server
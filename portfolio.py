@@ -0,0 +1,253 @@
+import os
+import sqlite3
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+# --- PORTFOLIO STORE CONFIGURATION ---
+PORTFOLIO_DB = os.environ.get('STOCKPICKER_PORTFOLIO_DB', 'portfolio.db')
+PORTFOLIO_CSV = 'my_portfolio.csv'
+CSV_COLUMNS = ['Ticker', 'Date Added', 'Price Added', 'Quantity', 'Account']
+DEFAULT_ACCOUNT = 'Default'
+CSV_MIGRATED = 1  # PRAGMA user_version once the legacy CSV has been considered for import
+
+
+class PortfolioStore:
+    """SQLite (WAL) lot store. Every write is a single short IMMEDIATE transaction,
+    so concurrent Streamlit sessions never overwrite each other's changes."""
+
+    def __init__(self, path=PORTFOLIO_DB, csv_path=PORTFOLIO_CSV):
+        self.path = path
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS lots (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    ticker TEXT NOT NULL,
+                    date_added TEXT NOT NULL,
+                    price_added REAL NOT NULL DEFAULT 0,
+                    quantity REAL NOT NULL DEFAULT 1,
+                    account TEXT NOT NULL DEFAULT 'Default'
+                )
+            """)
+            # Databases created before lots had quantities / accounts
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(lots)")}
+            if 'quantity' not in columns:
+                conn.execute("ALTER TABLE lots ADD COLUMN quantity REAL NOT NULL DEFAULT 1")
+            if 'account' not in columns:
+                conn.execute("ALTER TABLE lots ADD COLUMN account TEXT NOT NULL DEFAULT 'Default'")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_lots_ticker ON lots(ticker)")
+
+        # One-time migration from the old CSV file. user_version records that it ran,
+        # so emptying the portfolio later does not bring the CSV's lots back; a
+        # database that already holds lots is only marked.
+        def migrate(conn):
+            if conn.execute("PRAGMA user_version").fetchone()[0] >= CSV_MIGRATED:
+                return
+            empty = conn.execute("SELECT 1 FROM lots LIMIT 1").fetchone() is None
+            if empty and csv_path and os.path.exists(csv_path):
+                self._insert_csv(conn, csv_path)
+            conn.execute(f"PRAGMA user_version = {CSV_MIGRATED}")
+        self._write(migrate)
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _write(self, fn):
+        """Runs fn(conn) inside BEGIN IMMEDIATE ... COMMIT."""
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            result = fn(conn)
+            conn.execute("COMMIT")
+            return result
+        except:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    # --- Reads ---
+
+    def has_ticker(self, ticker):
+        conn = self._connect()
+        try:
+            return conn.execute("SELECT 1 FROM lots WHERE ticker = ? LIMIT 1", (ticker,)).fetchone() is not None
+        finally:
+            conn.close()
+
+    def lots(self):
+        """All lots (CSV column names plus 'Lot') with compact dtypes: categorical
+        Ticker / Account, int32 Lot and float32 prices and quantities."""
+        conn = self._connect()
+        try:
+            df = pd.read_sql_query(
+                "SELECT id AS 'Lot', ticker AS 'Ticker', date_added AS 'Date Added', price_added AS 'Price Added', "
+                "quantity AS 'Quantity', account AS 'Account' FROM lots ORDER BY id",
+                conn
+            )
+        finally:
+            conn.close()
+        return df.astype({
+            'Lot': 'int32', 'Ticker': 'category', 'Price Added': 'float32',
+            'Quantity': 'float32', 'Account': 'category',
+        })
+
+    def tickers(self):
+        conn = self._connect()
+        try:
+            return [r[0] for r in conn.execute("SELECT DISTINCT ticker FROM lots ORDER BY ticker")]
+        finally:
+            conn.close()
+
+    # --- Writes ---
+
+    def add_lot(self, ticker, price, date_added=None, quantity=1.0, account=DEFAULT_ACCOUNT):
+        """Appends a lot (a ticker may hold several, across accounts) and returns its id."""
+        date_added = date_added or datetime.now().strftime("%Y-%m-%d")
+        return self._write(lambda conn: conn.execute(
+            "INSERT INTO lots (ticker, date_added, price_added, quantity, account) VALUES (?, ?, ?, ?, ?)",
+            (ticker, date_added, float(price), float(quantity), account or DEFAULT_ACCOUNT)
+        ).lastrowid)
+
+    def add_if_missing(self, ticker, price, date_added=None):
+        """Adds a first lot for ticker atomically; False if it is already held."""
+        date_added = date_added or datetime.now().strftime("%Y-%m-%d")
+
+        def insert(conn):
+            if conn.execute("SELECT 1 FROM lots WHERE ticker = ? LIMIT 1", (ticker,)).fetchone():
+                return False
+            conn.execute(
+                "INSERT INTO lots (ticker, date_added, price_added) VALUES (?, ?, ?)",
+                (ticker, date_added, float(price))
+            )
+            return True
+        return self._write(insert)
+
+    def add_many(self, items, date_added=None):
+        """Adds a first lot for every (ticker, price) not already held, in one
+        transaction. Returns the tickers that were added."""
+        date_added = date_added or datetime.now().strftime("%Y-%m-%d")
+        items = [(str(t), float(p)) for t, p in items]
+
+        def insert(conn):
+            held = {r[0] for r in conn.execute("SELECT DISTINCT ticker FROM lots")}
+            rows = []
+            for ticker, price in items:
+                if ticker not in held:
+                    held.add(ticker)
+                    rows.append((ticker, date_added, price))
+            conn.executemany("INSERT INTO lots (ticker, date_added, price_added) VALUES (?, ?, ?)", rows)
+            return [r[0] for r in rows]
+        return self._write(insert)
+
+    def remove_ticker(self, ticker):
+        """Deletes every lot for ticker; returns the number removed."""
+        return self._write(lambda conn: conn.execute("DELETE FROM lots WHERE ticker = ?", (ticker,)).rowcount)
+
+    def remove_lot(self, lot_id):
+        return self._write(lambda conn: conn.execute("DELETE FROM lots WHERE id = ?", (int(lot_id),)).rowcount)
+
+    # --- CSV import / export ---
+
+    @staticmethod
+    def _read_csv(csv_path):
+        """Lot rows ready for INSERT from a my_portfolio.csv file."""
+        df = pd.read_csv(csv_path)
+        prices = pd.to_numeric(df['Price Added'], errors='coerce').fillna(0.0) if 'Price Added' in df else pd.Series(0.0, index=df.index)
+        quantities = pd.to_numeric(df['Quantity'], errors='coerce').fillna(1.0) if 'Quantity' in df else pd.Series(1.0, index=df.index)
+        today = datetime.now().strftime("%Y-%m-%d")
+        dates = df['Date Added'].fillna(today) if 'Date Added' in df else pd.Series(today, index=df.index)
+        accounts = df['Account'].fillna(DEFAULT_ACCOUNT) if 'Account' in df else pd.Series(DEFAULT_ACCOUNT, index=df.index)
+        return list(zip(
+            df['Ticker'].astype(str), dates.astype(str), prices.astype(float),
+            quantities.astype(float), accounts.astype(str)
+        ))
+
+    def _insert_csv(self, conn, csv_path):
+        rows = self._read_csv(csv_path)
+        conn.executemany(
+            "INSERT INTO lots (ticker, date_added, price_added, quantity, account) VALUES (?, ?, ?, ?, ?)", rows
+        )
+        return len(rows)
+
+    def import_csv(self, csv_path):
+        """Appends the lots from a my_portfolio.csv file (the legacy three-column
+        layout gets quantity 1 in the default account)."""
+        return self._write(lambda conn: self._insert_csv(conn, csv_path))
+
+    def export_csv(self, csv_path=None):
+        """Writes (or returns, when csv_path is None) the lots as CSV."""
+        df = self.lots()[CSV_COLUMNS]
+        if csv_path is None:
+            return df.to_csv(index=False)
+        df.to_csv(csv_path, index=False)
+        return csv_path
+
+
+# --- VALUATION (vectorized over lots) ---
+
+def _by_ticker(tickers, values, fill=np.nan):
+    """values (Series indexed by ticker) looked up for a categorical ticker column
+    through its category codes: one reindex per distinct ticker, not per lot."""
+    cats = tickers.cat
+    lookup = pd.Series(values, dtype=object).reindex(cats.categories).to_numpy()
+    return np.append(lookup, fill)[cats.codes]  # code -1 (missing ticker) reads the fill slot
+
+def value_lots(lots, prices):
+    """Per-lot market value, cost and unrealized P&L plus portfolio weight. prices
+    maps ticker -> current price (missing or 0 means no quote: NaN value). A lot
+    saved without a price (legacy rows at 0) is costed at the current price, so it
+    shows no gain instead of +100%."""
+    current = pd.to_numeric(_by_ticker(lots['Ticker'], prices), errors='coerce').astype(np.float64)
+    current[current <= 0] = np.nan
+    # Stored as float32, but money is computed in float64 so totals stay exact to the cent
+    quantity = lots['Quantity'].to_numpy(dtype=np.float64)
+    paid = lots['Price Added'].to_numpy(dtype=np.float64)
+    paid = np.where(paid > 0, paid, current)
+
+    value = quantity * current
+    cost = quantity * paid
+    gain = value - cost
+    total = np.nansum(value)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        gain_pct = np.where(cost > 0, gain / cost * 100, 0).astype(np.float32)
+        weight = (value / total * 100 if total > 0 else np.zeros_like(value)).astype(np.float32)
+    return lots.assign(**{
+        'Current Price': current.astype(np.float32),
+        'Cost': cost,
+        'Market Value': value,
+        'Gain/Loss $': gain,
+        'Gain/Loss %': gain_pct,
+        'Weight %': weight,
+    })
+
+def positions(valued, by=('Ticker',)):
+    """Lots from value_lots() aggregated into positions (default: one row per ticker)."""
+    agg = valued.groupby(list(by), observed=True)[['Quantity', 'Cost', 'Market Value', 'Gain/Loss $']].sum(min_count=1)
+    agg['Avg Cost'] = agg['Cost'] / agg['Quantity'].where(agg['Quantity'] != 0)
+    agg['Gain/Loss %'] = agg['Gain/Loss $'] / agg['Cost'].where(agg['Cost'] > 0) * 100
+    total = agg['Market Value'].sum()
+    agg['Weight %'] = agg['Market Value'] / total * 100 if total > 0 else 0.0
+    return agg.reset_index()
+
+def cost_basis(lots):
+    """Quantity-weighted average price paid per ticker (lots saved without a price
+    are left out)."""
+    paid = lots[lots['Price Added'] > 0]
+    tickers = paid['Ticker'].astype(str)
+    spent = (paid['Price Added'].astype(float) * paid['Quantity']).groupby(tickers).sum()
+    quantity = paid['Quantity'].astype(float).groupby(tickers).sum()
+    return spent / quantity.where(quantity > 0)
+
+def sector_exposure(valued, sectors):
+    """Market value and weight per sector; sectors maps ticker -> sector name."""
+    sector = pd.Series(_by_ticker(valued['Ticker'], sectors), index=valued.index)
+    sector = sector.where(sector.notna() & (sector != ''), 'Unknown').astype('category')
+    agg = valued['Market Value'].groupby(sector, observed=True).sum().rename_axis('Sector').to_frame()
+    total = agg['Market Value'].sum()
+    agg['Weight %'] = agg['Market Value'] / total * 100 if total > 0 else 0.0
+    return agg.sort_values('Market Value', ascending=False).reset_index()
@@ -0,0 +1,112 @@
+import os
+import threading
+import time
+
+from metrics import count_error, timed
+
+# --- PREFETCH CONFIGURATION ---
+# Seconds between background refreshes; 0 disables the worker (pages then compute on demand)
+PREFETCH_SECONDS = float(os.environ.get('STOCKPICKER_PREFETCH_SECONDS', str(15 * 60)))
+WATCH_SECONDS = 60 * 60        # how long scanned tickers stay on the prefetch list
+MAX_AGE_SECONDS = 15 * 60      # snapshot age pages accept when the worker is disabled
+MAX_WATCHED = 1000
+
+
+def _performance_bulk(tickers):
+    from market_data import get_performance_bulk
+    return get_performance_bulk(tickers)
+
+
+class PrefetchScheduler:
+    """Background worker that recomputes performance for held and recently scanned
+    tickers every `interval` seconds into one snapshot shared by every session."""
+
+    def __init__(self, tickers_fn, interval=PREFETCH_SECONDS, watch_seconds=WATCH_SECONDS, compute=_performance_bulk):
+        self.tickers_fn = tickers_fn
+        self.interval = interval
+        self.watch_seconds = watch_seconds
+        self.compute = compute
+        self.lock = threading.Lock()
+        self.wake = threading.Event()
+        self.thread = None
+        self.watched = {}  # ticker -> expiry time
+        self.listeners = []
+        self.perf = None
+        self.built_at = None
+        # Two missed intervals mean the worker is behind; without a worker the
+        # snapshot is only as fresh as the last on-demand refresh
+        self.max_age = 2 * interval if interval > 0 else MAX_AGE_SECONDS
+
+    def watch(self, tickers):
+        """Keeps tickers (e.g. scan results) warm for the next watch_seconds."""
+        expires = time.time() + self.watch_seconds
+        with self.lock:
+            for ticker in tickers:
+                self.watched[ticker] = expires
+            if len(self.watched) > MAX_WATCHED:
+                newest = sorted(self.watched.items(), key=lambda kv: kv[1])[-MAX_WATCHED:]
+                self.watched = dict(newest)
+
+    def subscribe(self, fn):
+        """Calls fn(perf) after every refresh (e.g. to evaluate alert rules)."""
+        with self.lock:
+            self.listeners.append(fn)
+
+    def tickers(self):
+        """Held tickers plus unexpired watched ones."""
+        now = time.time()
+        with self.lock:
+            self.watched = {t: exp for t, exp in self.watched.items() if exp > now}
+            watched = list(self.watched)
+        return list(dict.fromkeys(list(self.tickers_fn()) + watched))
+
+    def refresh(self):
+        """Recomputes the snapshot now (blocking) and returns it."""
+        tickers = self.tickers()
+        with timed('prefetch.refresh'):
+            perf = self.compute(tickers)
+        with self.lock:
+            self.perf = perf
+            self.built_at = time.time()
+            listeners = list(self.listeners)
+        for fn in listeners:
+            try:
+                fn(perf)
+            except Exception as e:
+                count_error('prefetch.listener', e)
+        return perf
+
+    def snapshot(self, tickers):
+        """(performance rows for tickers, age in seconds) from the last refresh, or
+        (None, None) when the snapshot does not cover every requested ticker yet or
+        is older than max_age."""
+        with self.lock:
+            perf, built_at = self.perf, self.built_at
+        if perf is None or not set(tickers) <= set(perf.index):
+            return None, None
+        age = time.time() - built_at
+        if age > self.max_age:
+            return None, None
+        return perf.loc[list(dict.fromkeys(tickers))], age
+
+    def trigger(self):
+        """Wakes the worker for an early refresh."""
+        self.wake.set()
+
+    def start(self):
+        """Starts the daemon worker once; a no-op when disabled or already running."""
+        with self.lock:
+            if self.interval <= 0 or (self.thread and self.thread.is_alive()):
+                return False
+            self.thread = threading.Thread(target=self._run, name="prefetch", daemon=True)
+        self.thread.start()
+        return True
+
+    def _run(self):
+        while True:
+            try:
+                self.refresh()
+            except Exception as e:
+                count_error('prefetch.refresh', e)
+            self.wake.wait(self.interval)
+            self.wake.clear()
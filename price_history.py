@@ -0,0 +1,232 @@
+import json
+import os
+import threading
+import time
+from datetime import timedelta
+
+import numpy as np
+import pandas as pd
+
+from cache import SingleFlight
+from metrics import count_error, timed
+from providers import PERIOD_DAYS, get_provider
+from startup import lazy_import
+
+# --- HISTORY STORE CONFIGURATION ---
+HISTORY_DIR = os.environ.get('STOCKPICKER_HISTORY_DIR', os.path.join('data', 'history'))
+REFRESH_SECONDS = 15 * 60      # same freshness as the 'history' cache kind
+BACKFILL_PERIOD = '1y'         # first download for a ticker; enough for the 52-week high
+FIELDS = ['Close', 'High']
+COVERAGE_KEY = b'stockpicker.coverage'
+
+
+def period_for(days):
+    """Smallest yfinance period that reaches `days` calendar days back."""
+    for period, span in PERIOD_DAYS.items():
+        if span is None or span >= days:
+            return period
+    return 'max'
+
+def _empty():
+    return pd.DataFrame({f: pd.Series(dtype='float64') for f in FIELDS}, index=pd.DatetimeIndex([], name='Date'))
+
+def _bulk_arrays(bulk, tickers):
+    """Splits a (field, ticker) download into a tz-naive daily index and one
+    dates x tickers float64 array per field."""
+    bulk = bulk.sort_index()
+    idx = pd.DatetimeIndex(bulk.index)
+    if idx.tz is not None:
+        idx = idx.tz_localize(None)
+    arrays = {}
+    for f in FIELDS:
+        if f not in bulk.columns.get_level_values(0):
+            arrays[f] = np.full((len(idx), len(tickers)), np.nan)
+            continue
+        block = bulk[f]
+        if isinstance(block, pd.Series):
+            block = block.to_frame(tickers[0])
+        arrays[f] = block.reindex(columns=list(tickers)).to_numpy('float64')
+    return idx.normalize().rename('Date'), arrays
+
+
+class PriceHistoryStore:
+    """Per-ticker daily bars in Parquet files (directory/<TICKER>.parquet).
+
+    Each file's metadata records the first date it covers and when it was last
+    fetched, so an update downloads only the tail since the last stored bar
+    (e.g. period='5d') instead of the whole look-back again."""
+
+    def __init__(self, directory=HISTORY_DIR, refresh_seconds=REFRESH_SECONDS, backfill=BACKFILL_PERIOD):
+        self.directory = directory
+        self.refresh_seconds = refresh_seconds
+        self.backfill = backfill
+        self.lock = threading.Lock()
+        self.flight = SingleFlight()
+        self._frames = {}  # ticker -> (mtime, frame, coverage)
+
+    def _path(self, ticker):
+        return os.path.join(self.directory, f"{ticker.replace('/', '_')}.parquet")
+
+    def _read(self, ticker):
+        """(frame, coverage) for ticker, memoized until its file changes; (None, None) if not stored."""
+        path = self._path(ticker)
+        try:
+            mtime = os.path.getmtime(path)
+        except OSError:
+            return None, None
+        with self.lock:
+            cached = self._frames.get(ticker)
+            if cached and cached[0] == mtime:
+                return cached[1], cached[2]
+
+        table = lazy_import('pyarrow.parquet').read_table(path)
+        coverage = json.loads((table.schema.metadata or {}).get(COVERAGE_KEY, b'{}'))
+        frame = table.to_pandas().set_index('Date')
+        with self.lock:
+            self._frames[ticker] = (mtime, frame, coverage)
+        return frame, coverage
+
+    def _write(self, ticker, frame, coverage):
+        pa = lazy_import('pyarrow')
+        pq = lazy_import('pyarrow.parquet')
+        table = pa.table(
+            {'Date': frame.index.to_numpy(), **{f: frame[f].to_numpy() for f in FIELDS}},
+            metadata={COVERAGE_KEY: json.dumps(coverage).encode('utf-8')}
+        )
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(ticker)
+        tmp = f"{path}.{threading.get_ident()}.tmp"
+        pq.write_table(table, tmp)
+        os.replace(tmp, path)
+        with self.lock:
+            self._frames[ticker] = (os.path.getmtime(path), frame, coverage)
+
+    def coverage(self, ticker):
+        """{'start': 'YYYY-MM-DD', 'fetched_at': epoch} for a stored ticker, else None."""
+        return self._read(ticker)[1]
+
+    def needed_period(self, ticker):
+        """Period to download for ticker: None while fresh, the backfill period when
+        nothing is stored, otherwise the smallest period reaching the last stored bar
+        (which is fetched again, since it may have been an intraday bar)."""
+        frame, coverage = self._read(ticker)
+        if frame is None:
+            return self.backfill
+        if time.time() - coverage.get('fetched_at', 0) < self.refresh_seconds:
+            return None
+        if frame.empty:
+            return self.backfill
+        return period_for((pd.Timestamp.now().normalize() - frame.index[-1]).days + 1)
+
+    def update(self, tickers):
+        """Fetches the missing tail of every stale ticker (one bulk download per period
+        size) and merges it into the stored files. Returns the tickers whose files were
+        written."""
+        groups = {}
+        for ticker in dict.fromkeys(tickers):
+            period = self.needed_period(ticker)
+            if period:
+                groups.setdefault(period, []).append(ticker)
+
+        fetched = []
+        for period, group in groups.items():
+            # Sessions updating the same tickers at once share one download + merge
+            fetched += self.flight.do((period, tuple(group)), lambda: self._fetch(period, group))
+        return fetched
+
+    def _fetch(self, period, group):
+        try:
+            with timed('history_store.update'):
+                bulk = get_provider().history_bulk(tuple(group), period)
+        except Exception as e:
+            count_error('history_store.update', e)
+            return []
+        index, arrays = _bulk_arrays(bulk, group)
+        return [
+            ticker for j, ticker in enumerate(group)
+            if self._merge(ticker, period, index, {f: a[:, j] for f, a in arrays.items()})
+        ]
+
+    def _merge(self, ticker, period, index, columns):
+        """Writes the stored bars before the new tail followed by the new tail. A
+        ticker the download returned no bars for keeps its stored file (and so stays
+        due for refresh, shown as stale); returns False then."""
+        has_bar = ~np.isnan(columns['Close'])
+        old, coverage = self._read(ticker)
+        if not has_bar.any() and old is not None and not old.empty:
+            return False
+        new = pd.DataFrame({f: v[has_bar] for f, v in columns.items()}, index=index[has_bar])
+        if old is not None and not old.empty:
+            new = pd.concat([old[old.index < new.index[0]], new]) if len(new) else old
+
+        today = pd.Timestamp.now().normalize()
+        span = PERIOD_DAYS.get(period)
+        start = today - timedelta(days=span) if span else (new.index[0] if len(new) else today)
+        if coverage and coverage.get('start'):
+            start = min(start, pd.Timestamp(coverage['start']))
+        self._write(ticker, new, {'start': start.strftime('%Y-%m-%d'), 'fetched_at': time.time()})
+        return True
+
+    # --- Reads (local only after the optional update) ---
+
+    def history(self, ticker, update=True):
+        """Stored daily bars for ticker (FIELDS columns), refreshing the tail first."""
+        if update:
+            self.update([ticker])
+        frame, _ = self._read(ticker)
+        return frame if frame is not None else _empty()
+
+    def closes(self, tickers, update=True):
+        """Date x ticker matrix of closes (NaN where a ticker has no bar that day)."""
+        tickers = list(dict.fromkeys(tickers))
+        if update:
+            self.update(tickers)
+        series = {}
+        for ticker in tickers:
+            frame, _ = self._read(ticker)
+            if frame is not None and not frame.empty:
+                series[ticker] = frame['Close']
+        return pd.DataFrame(series).reindex(columns=tickers)
+
+    def window(self, ticker, days, field='Close'):
+        """The last `days` calendar days of one field, sliced without copying."""
+        frame, _ = self._read(ticker)
+        if frame is None:
+            return pd.Series(dtype='float64')
+        start = frame.index.searchsorted(pd.Timestamp.now().normalize() - timedelta(days=days))
+        return frame[field].iloc[start:]
+
+    def high(self, ticker, days=365, max_age=24 * 60 * 60):
+        """Highest price over the last `days` from local data only, or None unless the
+        store covers that whole window and was fetched within max_age seconds."""
+        frame, coverage = self._read(ticker)
+        if frame is None or frame.empty:
+            return None
+        if time.time() - coverage.get('fetched_at', 0) > max_age:
+            return None
+        if pd.Timestamp(coverage['start']) > pd.Timestamp.now().normalize() - timedelta(days=days):
+            return None
+        highs = self.window(ticker, days, 'High')
+        if highs.isna().all():
+            highs = self.window(ticker, days, 'Close')
+        return float(highs.max())
+
+    def clear(self):
+        with self.lock:
+            self._frames.clear()
+        if os.path.isdir(self.directory):
+            for name in os.listdir(self.directory):
+                if name.endswith('.parquet'):
+                    os.remove(os.path.join(self.directory, name))
+
+
+_default_store = None
+_default_lock = threading.Lock()
+
+def get_history_store():
+    """Process-wide PriceHistoryStore instance."""
+    global _default_store
+    with _default_lock:
+        if _default_store is None:
+            _default_store = PriceHistoryStore()
+        return _default_store
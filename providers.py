@@ -0,0 +1,360 @@
+import hashlib
+import logging
+import os
+import pickle
+import random
+import re
+import threading
+import time
+
+import pandas as pd
+
+from health import BREAKERS, FAILURE_TYPES, NO_SLOW_LIMIT
+from metrics import timed
+from startup import lazy_import
+from transport import finviz_session, yahoo_session
+
+# --- PROVIDER CONFIGURATION ---
+# STOCKPICKER_PROVIDER: 'live' (default), 'record' (live + save fixtures) or 'replay' (fixtures only)
+PROVIDER_MODE = os.environ.get('STOCKPICKER_PROVIDER', 'live')
+FIXTURE_DIR = os.environ.get('STOCKPICKER_FIXTURES', os.path.join('data', 'fixtures'))
+FIXTURE_LATENCY = float(os.environ.get('STOCKPICKER_FIXTURE_LATENCY', '0'))
+FIXTURE_ERROR_RATE = float(os.environ.get('STOCKPICKER_FIXTURE_ERROR_RATE', '0'))  # injected upstream failures
+
+NEWS_COUNT = 20  # headlines requested per ticker
+PROBE_TICKER = os.environ.get('STOCKPICKER_PROBE_TICKER', 'SPY')  # quote that must load when Yahoo is up
+PROBE_URL = 'https://finviz.com/'
+
+# yfinance history periods, shortest first, with the calendar days each reaches back
+PERIOD_DAYS = {
+    '5d': 5, '1mo': 30, '2mo': 61, '3mo': 91, '6mo': 182,
+    '1y': 365, '2y': 730, '5y': 1826, 'max': None,
+}
+
+
+class DataProvider:
+    """Every upstream call the app makes. Return values have the same shape as the
+    yfinance / finvizfinance objects they come from; failures raise."""
+
+    def info(self, ticker):
+        raise NotImplementedError
+
+    def last_price(self, ticker):
+        raise NotImplementedError
+
+    def history(self, ticker, period="2mo"):
+        raise NotImplementedError
+
+    def history_bulk(self, tickers, period="2mo"):
+        """Multi-ticker daily bars with (field, ticker) columns."""
+        raise NotImplementedError
+
+    def news(self, ticker):
+        """Recent headline strings for ticker, newest first."""
+        raise NotImplementedError
+
+    def screener(self, filters_dict=None, order='Ticker'):
+        raise NotImplementedError
+
+    def universe(self, columns):
+        """Full-market Finviz custom screen with the given column ids."""
+        raise NotImplementedError
+
+    def ping(self, upstream):
+        """A request that succeeds whenever upstream ('yahoo' / 'finviz') is healthy;
+        circuit breakers use it as their recovery probe."""
+        raise NotImplementedError
+
+
+# A yf.download error message that means Yahoo could not be reached or refused to
+# serve, not "no such ticker": a connection / timeout exception repr, curl_cffi's
+# transport-failure text (e.g. DNSError('Failed to perform, curl: (6) ...')) or an
+# HTTP 429 / 5xx
+_UPSTREAM_ERROR = re.compile(
+    '|'.join(sorted(FAILURE_TYPES)) + r'|DNSError|Failed to perform, curl|Too Many Requests|\b(429|5\d\d)\b'
+)
+
+
+class _DownloadErrors(logging.Handler):
+    """Collects the per-ticker errors yf.download logs instead of raising, for the
+    calling thread only (download() logs them from the thread that called it)."""
+
+    def __init__(self):
+        super().__init__(logging.ERROR)
+        self.thread = threading.get_ident()
+        self.messages = []
+
+    def emit(self, record):
+        if record.thread == self.thread:
+            # "['AAA', 'BBB']: <error>" -> "<error>"
+            self.messages.append(record.getMessage().strip().split(']: ', 1)[-1])
+
+
+class LiveProvider(DataProvider):
+    """yfinance + finvizfinance over the shared pooled sessions in transport.py."""
+
+    def _ticker(self, ticker):
+        return lazy_import('yfinance').Ticker(ticker, session=yahoo_session())
+
+    def info(self, ticker):
+        return self._ticker(ticker).info
+
+    def last_price(self, ticker):
+        return self._ticker(ticker).fast_info['last_price']
+
+    def history(self, ticker, period="2mo"):
+        return self._ticker(ticker).history(period=period)
+
+    def history_bulk(self, tickers, period="2mo"):
+        yf = lazy_import('yfinance')
+        errors = _DownloadErrors()
+        logger = logging.getLogger('yfinance')
+        logger.addHandler(errors)
+        try:
+            df = yf.download(list(tickers), period=period, auto_adjust=True, group_by='column', threads=True,
+                             progress=False, session=yahoo_session())
+        finally:
+            logger.removeHandler(errors)
+        # yf.download reports failures as empty/NaN frames instead of raising; when
+        # nothing came back because Yahoo failed, raise something the breaker counts
+        if df is None or df.empty or df['Close'].isna().all().all():
+            detail = "; ".join(m for m in errors.messages if m and 'Failed download' not in m)[:500]
+            if _UPSTREAM_ERROR.search(detail):
+                raise ConnectionError(f"History download failed for {len(tickers)} tickers: {detail}")
+            raise ValueError(f"No price history returned for {len(tickers)} tickers{': ' + detail if detail else ''}")
+        return df
+
+    def news(self, ticker):
+        items = self._ticker(ticker).get_news(count=NEWS_COUNT) or []
+        titles = [(item.get('content') or item).get('title') for item in items]
+        return [t for t in titles if t]
+
+    def screener(self, filters_dict=None, order='Ticker'):
+        finviz_session()
+        screener = lazy_import('finvizfinance.screener.valuation').Valuation()
+        if filters_dict:
+            screener.set_filter(filters_dict=filters_dict)
+        return screener.screener_view(order=order, verbose=0)
+
+    def universe(self, columns):
+        finviz_session()
+        return lazy_import('finvizfinance.screener.custom').Custom().screener_view(columns=list(columns), limit=100000, verbose=0)
+
+    def ping(self, upstream):
+        if upstream == 'yahoo':
+            self.last_price(PROBE_TICKER)
+        else:
+            finviz_session().get(PROBE_URL, timeout=10).raise_for_status()
+
+
+class FixtureProvider(DataProvider):
+    """Records upstream responses to disk and replays them offline.
+
+    mode='record' forwards each call to upstream and pickles the result under
+    directory/<kind>/<hash>.pkl; mode='replay' only reads fixtures (a missing one
+    raises KeyError) and sleeps latency + uniform(0, jitter) seconds per call to
+    mimic the network. In replay, a share error_rate of calls fails with
+    ConnectionError after the delay, to exercise outage handling."""
+
+    def __init__(self, directory=FIXTURE_DIR, mode='replay', upstream=None, latency=0.0, jitter=0.0, error_rate=0.0):
+        self.directory = directory
+        self.mode = mode
+        self.upstream = upstream or LiveProvider()
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    def _path(self, kind, args):
+        digest = hashlib.sha1(repr(args).encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, kind, f"{digest}.pkl")
+
+    def save(self, kind, args, value):
+        path = self._path(kind, args)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp, 'wb') as f:
+            pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, path)
+
+    def load(self, kind, args):
+        path = self._path(kind, args)
+        if not os.path.exists(path):
+            raise KeyError(f"No {kind} fixture for {args!r}")
+        with open(path, 'rb') as f:
+            return pickle.load(f)
+
+    def _call(self, kind, args, fetch):
+        with self.lock:
+            self.calls += 1
+        if self.mode == 'record':
+            value = fetch()
+            self.save(kind, args, value)
+            return value
+        if self.latency or self.jitter:
+            time.sleep(self.latency + random.uniform(0, self.jitter))
+        if self.error_rate and random.random() < self.error_rate:
+            raise ConnectionError(f"Injected {kind} failure")
+        return self.load(kind, args)
+
+    def info(self, ticker):
+        return self._call('info', (ticker,), lambda: self.upstream.info(ticker))
+
+    def last_price(self, ticker):
+        return self._call('quote', (ticker,), lambda: self.upstream.last_price(ticker))
+
+    def _history_fixture(self, ticker, period):
+        """Recorded history for ticker, cut from the longest recorded period when this
+        exact period was never recorded."""
+        try:
+            return self.load('history', (ticker, period))
+        except KeyError:
+            pass
+        for recorded in reversed(list(PERIOD_DAYS)):
+            try:
+                df = self.load('history', (ticker, recorded))
+            except KeyError:
+                continue
+            days = PERIOD_DAYS.get(period)
+            if days is None or df.empty:
+                return df
+            return df[df.index >= df.index[-1] - pd.Timedelta(days=days)]
+        raise KeyError(f"No history fixture for {ticker!r}")
+
+    def history(self, ticker, period="2mo"):
+        try:
+            return self._call('history', (ticker, period), lambda: self.upstream.history(ticker, period))
+        except KeyError:
+            return self._history_fixture(ticker, period)
+
+    def history_bulk(self, tickers, period="2mo"):
+        tickers = tuple(tickers)
+        try:
+            return self._call('history_bulk', (tickers, period), lambda: self.upstream.history_bulk(tickers, period))
+        except KeyError:
+            # No recording of this exact basket: assemble it from per-ticker fixtures
+            frames = {}
+            for t in tickers:
+                try:
+                    frames[t] = self._history_fixture(t, period)
+                except KeyError:
+                    continue
+            if not frames:
+                raise
+            return pd.concat(frames, axis=1).swaplevel(0, 1, axis=1).sort_index(axis=1)
+
+    def news(self, ticker):
+        return self._call('news', (ticker,), lambda: self.upstream.news(ticker))
+
+    def screener(self, filters_dict=None, order='Ticker'):
+        key = (tuple(sorted((filters_dict or {}).items())), order)
+        return self._call('screener', key, lambda: self.upstream.screener(filters_dict, order))
+
+    def universe(self, columns):
+        return self._call('universe', (tuple(columns),), lambda: self.upstream.universe(columns))
+
+    def ping(self, upstream):
+        if self.mode == 'record':
+            return self.upstream.ping(upstream)
+        if self.latency or self.jitter:
+            time.sleep(self.latency + random.uniform(0, self.jitter))
+        if self.error_rate and random.random() < self.error_rate:
+            raise ConnectionError(f"Injected {upstream} ping failure")
+
+
+class InstrumentedProvider(DataProvider):
+    """Times every call on the wrapped provider as '<upstream>.<call>' in METRICS."""
+
+    def __init__(self, inner):
+        self.inner = inner
+
+    def info(self, ticker):
+        with timed('yahoo.info'):
+            return self.inner.info(ticker)
+
+    def last_price(self, ticker):
+        with timed('yahoo.quote'):
+            return self.inner.last_price(ticker)
+
+    def history(self, ticker, period="2mo"):
+        with timed('yahoo.history'):
+            return self.inner.history(ticker, period)
+
+    def history_bulk(self, tickers, period="2mo"):
+        with timed('yahoo.history_bulk'):
+            return self.inner.history_bulk(tickers, period)
+
+    def news(self, ticker):
+        with timed('yahoo.news'):
+            return self.inner.news(ticker)
+
+    def screener(self, filters_dict=None, order='Ticker'):
+        with timed('finviz.screener'):
+            return self.inner.screener(filters_dict, order)
+
+    def universe(self, columns):
+        with timed('finviz.universe'):
+            return self.inner.universe(columns)
+
+    def ping(self, upstream):
+        with timed(f'{upstream}.ping'):
+            return self.inner.ping(upstream)
+
+
+class GuardedProvider(DataProvider):
+    """Sends every call through its upstream's circuit breaker (health.py), so an
+    upstream that is down fails fast with UpstreamUnavailable instead of every
+    ticker waiting for its own timeout. Each breaker probes recovery with ping().
+    Finviz screens (1s pause per result page) and bulk history downloads are slow by
+    design, so they are exempt from the slow-call limit and rely on transport
+    timeouts."""
+
+    def __init__(self, inner, breakers=None):
+        self.inner = inner
+        self.breakers = breakers or BREAKERS
+        for name, breaker in self.breakers.items():
+            breaker.probe = lambda name=name: self.inner.ping(name)
+
+    def info(self, ticker):
+        return self.breakers['yahoo'].call(lambda: self.inner.info(ticker))
+
+    def last_price(self, ticker):
+        return self.breakers['yahoo'].call(lambda: self.inner.last_price(ticker))
+
+    def history(self, ticker, period="2mo"):
+        return self.breakers['yahoo'].call(lambda: self.inner.history(ticker, period))
+
+    def history_bulk(self, tickers, period="2mo"):
+        return self.breakers['yahoo'].call(lambda: self.inner.history_bulk(tickers, period), NO_SLOW_LIMIT)
+
+    def news(self, ticker):
+        return self.breakers['yahoo'].call(lambda: self.inner.news(ticker))
+
+    def screener(self, filters_dict=None, order='Ticker'):
+        return self.breakers['finviz'].call(lambda: self.inner.screener(filters_dict, order), NO_SLOW_LIMIT)
+
+    def universe(self, columns):
+        return self.breakers['finviz'].call(lambda: self.inner.universe(columns), NO_SLOW_LIMIT)
+
+
+_provider = None
+_provider_lock = threading.Lock()
+
+def get_provider():
+    """Process-wide provider chosen by STOCKPICKER_PROVIDER."""
+    global _provider
+    with _provider_lock:
+        if _provider is None:
+            if PROVIDER_MODE in ('record', 'replay'):
+                inner = FixtureProvider(FIXTURE_DIR, mode=PROVIDER_MODE, latency=FIXTURE_LATENCY, error_rate=FIXTURE_ERROR_RATE)
+            else:
+                inner = LiveProvider()
+            _provider = GuardedProvider(InstrumentedProvider(inner))
+        return _provider
+
+def set_provider(provider):
+    """Swaps the process-wide provider (benchmarks, offline runs)."""
+    global _provider
+    with _provider_lock:
+        _provider = GuardedProvider(InstrumentedProvider(provider))
@@ -0,0 +1,271 @@
+import argparse
+import itertools
+import json
+import math
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, as_completed, wait
+from datetime import datetime
+
+from health import get_breaker
+from market_data import CACHE, HISTORY, fetch_info, fetch_screener
+from metrics import METRICS, count_error
+from sector_stats import SECTORS
+from universe import get_universe_snapshot, STRATEGIES, SORT_MAP, MARKET_CAPS, build_filters, screen_snapshot
+
+# --- SCANNER CONFIGURATION ---
+STRATEGY_ALIASES = {
+    'custom': "Custom (Manual)",
+    'insider': "Insider Buying (Follow the Money)",
+    'oversold': "Oversold Quality (Dip Buying)",
+    'squeeze': "Short Squeeze (High Risk/Reward)",
+}
+
+SORT_ALIASES = {
+    'pe': "Lowest P/E (Cheapest Earnings)",
+    'pb': "Lowest P/B (Cheapest Assets)",
+    'performance': "Worst Performance (Biggest Discount)",
+}
+
+
+class RateLimiter:
+    """Token bucket shared by the fetch workers (rate = requests per second)."""
+    def __init__(self, rate=8.0, burst=8):
+        self.rate = float(rate)
+        self.capacity = float(burst)
+        self.tokens = float(burst)
+        self.last = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        start = time.perf_counter()
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.last) * self.rate)
+                self.last = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    METRICS.observe('scanner.rate_limit_wait', time.perf_counter() - start)
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+# --- SCREENING ---
+
+def run_screen(filters_dict, order='Price/Earnings', source='live', universe=None):
+    """Screener rows for one filter set, from live Finviz or the local snapshot."""
+    if source == 'live':
+        return fetch_screener(filters_dict, order=order)
+    snapshot = (universe or get_universe_snapshot()).load()
+    if snapshot is None:
+        raise RuntimeError("Market snapshot is not downloaded yet, try again shortly.")
+    return screen_snapshot(snapshot, filters_dict, order=order)
+
+
+# --- ENRICHMENT ---
+
+def enrich_scan_row(row, limiter=None):
+    """Adds live price and 52W discount to one Finviz screener row. Stale marks rows
+    built from expired cached info while Yahoo is unreachable."""
+    discount = None
+    discount_str = "-"
+    stale = False
+    try:
+        current_price = float(row.get('Price', 0))
+    except:
+        current_price = 0.0
+
+    try:
+        # While Yahoo's circuit is open fetches fail (or fall back to the cache) at
+        # once, so there is nothing to pace
+        if limiter and get_breaker('yahoo').is_available(): limiter.acquire()
+        tinfo = fetch_info(row['Ticker'])
+        stale = CACHE.is_stale('info', (row['Ticker'],))
+        # Prefer the locally stored year of bars (held / recently viewed tickers)
+        high_52 = HISTORY.high(row['Ticker']) or tinfo.get('fiftyTwoWeekHigh', 0)
+        current_price = tinfo.get('currentPrice', current_price)
+
+        if high_52 > 0:
+            discount = ((high_52 - current_price) / high_52) * 100
+            discount_str = f"🔻 {discount:.1f}%"
+    except Exception as e:
+        count_error('scanner.enrich', e)
+
+    return {
+        'Ticker': row['Ticker'],
+        'Price': current_price,
+        'P/E': row.get('P/E', '-'),
+        'P/B': row.get('P/B', '-'),
+        'Discount': discount,
+        'Discount_Str': discount_str,
+        'Stale': stale
+    }
+
+def iter_enriched(rows, max_workers=8, rate=8.0):
+    """Yields (position, record) as rows finish. At most 4 x max_workers rows are
+    in flight, so an arbitrarily long row iterator never sits in memory at once."""
+    limiter = RateLimiter(rate=rate, burst=max_workers)
+    window = max_workers * 4
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        pending = {}
+        for i, row in enumerate(rows):
+            pending[pool.submit(enrich_scan_row, row, limiter)] = i
+            if len(pending) >= window:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield pending.pop(future), future.result()
+        for future in as_completed(pending):
+            yield pending[future], future.result()
+
+def enrich_scan_rows(df, max_workers=8, rate=8.0, on_progress=None):
+    """Enriches screener rows concurrently; output keeps the input order."""
+    results = [None] * len(df)
+    rows = (row for _, row in df.iterrows())
+    for done, (i, record) in enumerate(iter_enriched(rows, max_workers, rate), start=1):
+        results[i] = record
+        if on_progress: on_progress(done, len(results))
+    return results
+
+
+# --- BATCH OUTPUT ---
+
+def _clean(value):
+    """JSON/Parquet-safe scalar: NaN and '-' placeholders become None."""
+    if value is None or value == '-':
+        return None
+    if isinstance(value, float) and math.isnan(value):
+        return None
+    if hasattr(value, 'item'):
+        return value.item()
+    return value
+
+def iter_batch_scan(strategies, sectors, market_caps, sort_criteria, max_stocks=50,
+                    source='snapshot', max_workers=8, rate=8.0):
+    """Yields one flat record per enriched row for every strategy x sector x market-cap combination."""
+    universe = get_universe_snapshot()
+    if source == 'snapshot':
+        universe.get()
+
+    order = SORT_MAP[sort_criteria]
+    scanned_at = datetime.now().isoformat(timespec='seconds')
+
+    for strategy, sector, market_cap in itertools.product(strategies, sectors, market_caps):
+        filters_dict = build_filters(strategy, {'Market Cap.': market_cap})
+        if sector != "Any":
+            filters_dict['Sector'] = sector
+        try:
+            df = run_screen(filters_dict, order=order, source=source, universe=universe)
+        except Exception as e:
+            print(f"{strategy} / {sector} / {market_cap}: {e}", file=sys.stderr)
+            continue
+        if df is None or df.empty:
+            continue
+        if max_stocks:
+            df = df.head(max_stocks)
+
+        rows = (row for _, row in df.iterrows())
+        for rank, record in iter_enriched(rows, max_workers, rate):
+            yield {
+                'strategy': strategy,
+                'sector': sector,
+                'market_cap': market_cap,
+                'sort': sort_criteria,
+                'rank': rank + 1,
+                'scanned_at': scanned_at,
+                'Ticker': record['Ticker'],
+                'Price': _clean(record['Price']),
+                'P/E': _clean(record['P/E']),
+                'P/B': _clean(record['P/B']),
+                'Discount': _clean(record['Discount']),
+                'Discount_Str': record['Discount_Str'],
+                'Stale': record['Stale'],
+            }
+
+def write_ndjson(records, out):
+    count = 0
+    for record in records:
+        out.write(json.dumps(record) + "\n")
+        out.flush()
+        count += 1
+    return count
+
+def write_parquet(records, path, batch_size=500):
+    """Writes records as Parquet row groups of batch_size, never holding more than one batch."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema([
+        ('strategy', pa.string()), ('sector', pa.string()), ('market_cap', pa.string()),
+        ('sort', pa.string()), ('rank', pa.int64()), ('scanned_at', pa.string()),
+        ('Ticker', pa.string()), ('Price', pa.float64()), ('P/E', pa.float64()),
+        ('P/B', pa.float64()), ('Discount', pa.float64()), ('Discount_Str', pa.string()),
+        ('Stale', pa.bool_()),
+    ])
+    count = 0
+    with pq.ParquetWriter(path, schema) as writer:
+        batch = []
+        for record in records:
+            batch.append(record)
+            if len(batch) >= batch_size:
+                writer.write_table(pa.Table.from_pylist(batch, schema=schema))
+                count += len(batch)
+                batch = []
+        if batch:
+            writer.write_table(pa.Table.from_pylist(batch, schema=schema))
+            count += len(batch)
+    return count
+
+
+def _expand(values, choices, aliases=None):
+    """'all' -> every choice; otherwise resolve aliases and validate."""
+    if not values or values == ['all']:
+        return list(choices)
+    resolved = [(aliases or {}).get(v, v) for v in values]
+    for v in resolved:
+        if v not in choices:
+            raise SystemExit(f"Unknown choice: {v}")
+    return resolved
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Headless batch market scanner.")
+    parser.add_argument('--strategy', nargs='+', default=['all'],
+                        help=f"'all' or any of: {', '.join(STRATEGY_ALIASES)}")
+    parser.add_argument('--sector', nargs='+', default=['Any'], help="'all', 'Any' or sector names")
+    parser.add_argument('--market-cap', nargs='+', default=['Any'], help="'all', 'Any' or Finviz market-cap options")
+    parser.add_argument('--sort', default='pe', choices=list(SORT_ALIASES))
+    parser.add_argument('--max-stocks', type=int, default=50, help="rows enriched per combination (0 = all)")
+    parser.add_argument('--source', default='snapshot', choices=['snapshot', 'live'])
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--rate', type=float, default=8.0, help="Yahoo requests per second")
+    parser.add_argument('--format', default='ndjson', choices=['ndjson', 'parquet'])
+    parser.add_argument('--output', default='-', help="file path, '-' for stdout (ndjson only)")
+    args = parser.parse_args(argv)
+
+    records = iter_batch_scan(
+        strategies=_expand(args.strategy, STRATEGIES, STRATEGY_ALIASES),
+        sectors=_expand(args.sector, ["Any"] + SECTORS),
+        market_caps=_expand(args.market_cap, MARKET_CAPS),
+        sort_criteria=SORT_ALIASES[args.sort],
+        max_stocks=args.max_stocks,
+        source=args.source,
+        max_workers=args.workers,
+        rate=args.rate,
+    )
+
+    if args.format == 'parquet':
+        if args.output == '-':
+            raise SystemExit("--format parquet needs --output PATH")
+        count = write_parquet(records, args.output)
+    elif args.output == '-':
+        count = write_ndjson(records, sys.stdout)
+    else:
+        with open(args.output, 'w') as out:
+            count = write_ndjson(records, out)
+    print(f"Wrote {count} rows", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
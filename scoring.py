@@ -0,0 +1,77 @@
+import numpy as np
+import pandas as pd
+
+# --- SCORING CONFIGURATION ---
+# metric (get_stock_data_safe key) -> (label, better, default weight)
+METRICS = {
+    'pe': ("P/E Ratio", 'low', 1.0),
+    'ev_fcf': ("EV / Free Cash Flow", 'low', 1.0),
+    'revenue_growth': ("Revenue Growth", 'high', 1.0),
+    'operating_margin': ("Operating Margin", 'high', 1.0),
+    'debt_ebitda': ("Net Debt / EBITDA", 'low', 1.0),
+}
+
+# 0 / negative means "not meaningful" (unprofitable, negative FCF) and scores 0
+POSITIVE_ONLY = {'pe', 'ev_fcf'}
+
+DEFAULT_WEIGHTS = {metric: spec[2] for metric, spec in METRICS.items()}
+
+
+def metric_scores(df, sector_index=None):
+    """0-1 score per metric column (1 = best). Ranks are taken across the compared
+    tickers, or against each ticker's whole sector when sector_index is given and
+    has data for that sector/metric."""
+    scores = pd.DataFrame(index=df.index)
+    for metric, (_, better, _) in METRICS.items():
+        values = pd.to_numeric(df[metric], errors='coerce').astype(float)
+        if metric in POSITIVE_ONLY:
+            values = values.where(values > 0)
+
+        pct = values.rank(pct=True, method='average', ascending=(better == 'high'))
+
+        if sector_index is not None:
+            for sector, idx in df.groupby('sector').groups.items():
+                sector_pct = sector_index.percentiles(sector, metric, values.loc[idx].to_numpy())
+                if sector_pct is None:
+                    continue
+                sector_pct = pd.Series(sector_pct / 100, index=idx)
+                if better == 'low':
+                    sector_pct = 1 - sector_pct
+                pct.loc[idx] = sector_pct.where(values.loc[idx].notna(), np.nan)
+
+        scores[metric] = pct.fillna(0.0).clip(0, 1)
+    return scores
+
+
+def sector_percentiles(df, sector_index):
+    """Where each row's metrics sit in its own sector's distribution (0-100), one
+    column per scoring metric; NaN where the sector index has no data."""
+    out = pd.DataFrame(np.nan, index=df.index, columns=list(METRICS))
+    for sector, idx in df.groupby('sector').groups.items():
+        for metric in METRICS:
+            values = pd.to_numeric(df.loc[idx, metric], errors='coerce').to_numpy(dtype=float)
+            pct = sector_index.percentiles(sector, metric, values)
+            if pct is not None:
+                out.loc[idx, metric] = pct
+    return out
+
+
+def score_frame(df, weights=None, sector_index=None):
+    """Adds '<metric> score' columns, a weighted 0-100 'Score' and 'Rank' to a
+    DataFrame of get_stock_data_safe rows, sorted best first."""
+    weights = {**DEFAULT_WEIGHTS, **(weights or {})}
+    if df.empty:
+        return df.assign(Score=pd.Series(dtype=float), Rank=pd.Series(dtype=int))
+
+    scores = metric_scores(df, sector_index)
+    w = pd.Series({m: float(weights.get(m, 0)) for m in METRICS})
+    total = w.sum()
+    composite = scores[list(METRICS)].to_numpy() @ w.to_numpy() / total * 100 if total > 0 else np.zeros(len(df))
+
+    out = df.copy()
+    for metric in METRICS:
+        out[f"{metric} score"] = scores[metric]
+    out['Score'] = composite
+    out = out.sort_values('Score', ascending=False, kind='stable')
+    out['Rank'] = np.arange(1, len(out) + 1)
+    return out.reset_index(drop=True)
@@ -0,0 +1,208 @@
+import sqlite3
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from metrics import timed
+
+from cache import CACHE_PATH
+from universe import get_universe_snapshot
+
+# --- SECTOR INDEX CONFIGURATION ---
+SECTORS = ["Basic Materials", "Communication Services", "Consumer Cyclical", "Consumer Defensive", "Energy",
+           "Financial", "Healthcare", "Industrials", "Real Estate", "Technology", "Utilities"]
+
+REFRESH_SECONDS = 12 * 60 * 60
+
+# Finviz column -> metric name used by get_stock_data_safe.
+# P/FCF stands in for EV/FCF and Sales Q/Q for revenueGrowth.
+METRICS = {
+    'P/E': 'pe',
+    'P/B': 'pb',
+    'P/FCF': 'ev_fcf',
+    'Sales Q/Q': 'revenue_growth',
+    'Oper M': 'operating_margin',
+}
+
+# Ratios where zero/negative means "not meaningful" (same convention as the app)
+POSITIVE_ONLY = {'pe', 'pb', 'ev_fcf'}
+
+QUANTILE_LEVELS = np.linspace(0, 100, 21)  # every 5th percentile
+
+
+def fetch_sector_universe():
+    """Latest full-market snapshot, shared with the scanner's local mode."""
+    return get_universe_snapshot().get()
+
+
+def compute_sector_stats(universe_df):
+    """Aggregates a screener frame into one row per (sector, metric)."""
+    rows = []
+    if universe_df is None or universe_df.empty:
+        return rows
+
+    for column, metric in METRICS.items():
+        if column not in universe_df.columns:
+            continue
+        values = pd.to_numeric(universe_df[column], errors='coerce')
+        if metric in POSITIVE_ONLY:
+            values = values.where(values > 0)
+        grouped = pd.DataFrame({'Sector': universe_df['Sector'], 'v': values}).dropna().groupby('Sector')['v']
+
+        for sector, series in grouped:
+            if sector not in SECTORS:
+                continue
+            arr = series.to_numpy(dtype=np.float64)
+            rows.append({
+                'sector': sector,
+                'metric': metric,
+                'count': int(arr.size),
+                'mean': float(arr.mean()),
+                'median': float(np.median(arr)),
+                'quantiles': np.percentile(arr, QUANTILE_LEVELS).astype(np.float32),
+            })
+    return rows
+
+
+class SectorStatsIndex:
+    """Per-sector P/E, P/B and derived-metric distributions, stored in a local SQLite table."""
+
+    def __init__(self, path=CACHE_PATH, refresh_seconds=REFRESH_SECONDS, fetch=fetch_sector_universe):
+        self.path = path
+        self.refresh_seconds = refresh_seconds
+        self.fetch = fetch
+        self.stats = None
+        self.built_at = 0.0
+        self.lock = threading.Lock()
+        self.refreshing = False
+
+        with self._connect() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS sector_stats (
+                    sector TEXT NOT NULL,
+                    metric TEXT NOT NULL,
+                    count INTEGER NOT NULL,
+                    mean REAL,
+                    median REAL,
+                    quantiles BLOB NOT NULL,
+                    built_at REAL NOT NULL,
+                    PRIMARY KEY (sector, metric)
+                )
+            """)
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    def load(self):
+        """Reads the stored table into memory (one query, then O(1) dict lookups)."""
+        with self._connect() as conn:
+            rows = conn.execute("SELECT sector, metric, count, mean, median, quantiles, built_at FROM sector_stats").fetchall()
+        stats = {}
+        built_at = 0.0
+        for sector, metric, count, mean, median, blob, ts in rows:
+            stats[(sector, metric)] = {
+                'count': count,
+                'mean': mean,
+                'median': median,
+                'quantiles': np.frombuffer(blob, dtype=np.float32),
+            }
+            built_at = max(built_at, ts)
+        with self.lock:
+            self.stats = stats
+            self.built_at = built_at
+        return stats
+
+    def is_stale(self):
+        if self.stats is None:
+            self.load()
+        return time.time() - self.built_at > self.refresh_seconds
+
+    def build(self, universe_df=None):
+        """Rebuilds the whole index from one screener snapshot."""
+        if universe_df is None:
+            universe_df = self.fetch()
+        rows = compute_sector_stats(universe_df)
+        if not rows:
+            return 0
+
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("DELETE FROM sector_stats")
+            conn.executemany(
+                "INSERT INTO sector_stats (sector, metric, count, mean, median, quantiles, built_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [(r['sector'], r['metric'], r['count'], r['mean'], r['median'], r['quantiles'].tobytes(), now) for r in rows]
+            )
+        self.load()
+        return len(rows)
+
+    def refresh_async(self):
+        """Rebuilds in a background thread if the index is stale and no rebuild is running."""
+        with self.lock:
+            if self.refreshing:
+                return False
+            self.refreshing = True
+
+        if not self.is_stale():
+            with self.lock:
+                self.refreshing = False
+            return False
+
+        def run():
+            try:
+                with timed('sector_stats.refresh'):
+                    self.build()
+            except:
+                pass
+            finally:
+                with self.lock:
+                    self.refreshing = False
+
+        threading.Thread(target=run, name="sector-stats-refresh", daemon=True).start()
+        return True
+
+    def lookup(self, sector, metric):
+        """Summary stats for one sector/metric, or None if not indexed."""
+        if self.stats is None:
+            self.load()
+        entry = self.stats.get((sector, metric))
+        if entry is None:
+            return None
+        q = entry['quantiles']
+        return {
+            'count': entry['count'],
+            'mean': entry['mean'],
+            'median': entry['median'],
+            'p10': float(q[2]),
+            'p25': float(q[5]),
+            'p75': float(q[15]),
+            'p90': float(q[18]),
+        }
+
+    def averages(self, sector):
+        """(mean P/E, mean P/B) for a sector, None when unknown."""
+        pe = self.lookup(sector, 'pe')
+        pb = self.lookup(sector, 'pb')
+        return (pe['mean'] if pe else None), (pb['mean'] if pb else None)
+
+    def percentiles(self, sector, metric, values):
+        """Where each value sits in the sector distribution (0-100; NaN where not
+        meaningful), or None if the sector/metric is not indexed."""
+        if self.stats is None:
+            self.load()
+        entry = self.stats.get((sector, metric))
+        if entry is None:
+            return None
+        values = np.asarray(values, dtype=np.float64)
+        pct = np.interp(values, entry['quantiles'], QUANTILE_LEVELS)
+        invalid = np.isnan(values)
+        if metric in POSITIVE_ONLY:
+            invalid |= values <= 0
+        return np.where(invalid, np.nan, pct)
+
+
+if __name__ == "__main__":
+    index = SectorStatsIndex()
+    count = index.build()
+    print(f"Indexed {count} sector/metric rows")
@@ -0,0 +1,138 @@
+import hashlib
+import multiprocessing
+import os
+import sqlite3
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import pandas as pd
+
+from cache import CACHE_PATH
+from metrics import count_error, timed
+from startup import lazy_import
+
+# --- SENTIMENT CONFIGURATION ---
+SENTIMENT_WORKERS = int(os.environ.get('STOCKPICKER_SENTIMENT_WORKERS', str(min(4, os.cpu_count() or 1))))
+BATCH_SIZE = 256               # headlines per process-pool task
+PROCESS_THRESHOLD = 2000       # fewer new headlines are scored in-process (pool startup costs more)
+MAX_HEADLINES = 50             # per ticker
+
+
+def headline_hash(text):
+    """Content hash of a headline, ignoring case and whitespace differences."""
+    return hashlib.sha1(" ".join(text.lower().split()).encode('utf-8')).hexdigest()
+
+def polarity_batch(texts):
+    """TextBlob polarity (-1..1) for each text. Runs in the worker processes; only
+    the bundled lexicon is used, so no NLTK corpora are needed."""
+    TextBlob = lazy_import('textblob').TextBlob
+    return [float(TextBlob(t).sentiment.polarity) for t in texts]
+
+
+class SentimentStore:
+    """Polarity per headline keyed by content hash, stored in a SQLite table next to
+    the market cache, so a headline is scored once no matter how many scans see it."""
+
+    def __init__(self, path=CACHE_PATH, workers=SENTIMENT_WORKERS):
+        self.path = path
+        self.workers = workers
+        self.lock = threading.Lock()
+        self._pool = None
+        with self._connect() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS headline_sentiment (
+                    hash TEXT PRIMARY KEY,
+                    polarity REAL NOT NULL
+                )
+            """)
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    def _executor(self):
+        # 'spawn' workers: forking a process that already runs Streamlit's threads is unsafe
+        with self.lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context('spawn'))
+            return self._pool
+
+    def lookup(self, hashes):
+        hashes = list(hashes)
+        known = {}
+        with self._connect() as conn:
+            for i in range(0, len(hashes), 500):
+                chunk = hashes[i:i + 500]
+                rows = conn.execute(
+                    f"SELECT hash, polarity FROM headline_sentiment WHERE hash IN ({','.join('?' * len(chunk))})", chunk
+                ).fetchall()
+                known.update(rows)
+        return known
+
+    def score(self, headlines):
+        """Polarity for each headline; only hashes never seen before are scored, in
+        batches across the process pool when there are enough of them."""
+        hashes = [headline_hash(t) for t in headlines]
+        known = self.lookup(set(hashes))
+        todo = list({h: t for h, t in zip(hashes, headlines) if h not in known}.items())
+
+        if todo:
+            batches = [todo[i:i + BATCH_SIZE] for i in range(0, len(todo), BATCH_SIZE)]
+            texts = [[t for _, t in batch] for batch in batches]
+            with timed('sentiment.score'):
+                if len(todo) >= PROCESS_THRESHOLD and self.workers > 1:
+                    results = list(self._executor().map(polarity_batch, texts))
+                else:
+                    results = [polarity_batch(batch) for batch in texts]
+            new = {h: p for batch, pols in zip(batches, results) for (h, _), p in zip(batch, pols)}
+            with self._connect() as conn:
+                conn.executemany("INSERT OR REPLACE INTO headline_sentiment (hash, polarity) VALUES (?, ?)", new.items())
+            known.update(new)
+
+        return [known[h] for h in hashes]
+
+    def clear(self):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM headline_sentiment")
+
+
+def ticker_sentiment(tickers, store=None):
+    """Mean headline polarity and headline count per ticker (Sentiment is NaN when a
+    ticker has no news)."""
+    from market_data import fetch_many_blocking
+
+    tickers = list(dict.fromkeys(tickers))
+    news = fetch_many_blocking(tickers, ('news',))
+    owners, headlines = [], []
+    for ticker in tickers:
+        items = (news[ticker]['news'] or [])[:MAX_HEADLINES]
+        owners += [ticker] * len(items)
+        headlines += items
+
+    polarity = (store or get_sentiment_store()).score(headlines)
+    agg = pd.DataFrame({'Ticker': owners, 'Polarity': polarity}).groupby('Ticker')['Polarity'].agg(['mean', 'count'])
+    agg = agg.reindex(tickers)
+    return pd.DataFrame({'Sentiment': agg['mean'], 'Headlines': agg['count'].fillna(0).astype(int)}, index=tickers)
+
+
+_default_store = None
+_default_lock = threading.Lock()
+_jobs = ThreadPoolExecutor(max_workers=2, thread_name_prefix="sentiment")
+
+def get_sentiment_store():
+    """Process-wide SentimentStore instance."""
+    global _default_store
+    with _default_lock:
+        if _default_store is None:
+            _default_store = SentimentStore()
+        return _default_store
+
+def submit_sentiment(tickers):
+    """Runs ticker_sentiment in the background and returns its Future, so pages
+    render immediately and pick the column up when it is ready."""
+    def run():
+        try:
+            return ticker_sentiment(tickers)
+        except Exception as e:
+            count_error('sentiment', e)
+            raise
+    return _jobs.submit(run)
@@ -0,0 +1,50 @@
+import importlib
+import os
+import sys
+import threading
+import time
+
+# --- STARTUP CONFIGURATION ---
+# STOCKPICKER_PRELOAD=1 imports the heavy data libraries at boot instead of on first use
+PRELOAD = os.environ.get('STOCKPICKER_PRELOAD', '0') == '1'
+
+HEAVY_MODULES = ['pandas', 'numpy', 'pyarrow', 'yfinance', 'finvizfinance', 'textblob', 'nltk']
+
+IMPORT_TIMES = {}
+_import_lock = threading.Lock()
+
+
+def lazy_import(name):
+    """Imports a module on first use and records how long that first import took."""
+    module = sys.modules.get(name)
+    if module is not None:
+        return module
+    with _import_lock:
+        start = time.perf_counter()
+        module = importlib.import_module(name)
+        IMPORT_TIMES.setdefault(name, time.perf_counter() - start)
+    return module
+
+
+def preload():
+    """Imports every heavy module now (for replicas that prefer a warm first request)."""
+    for name in HEAVY_MODULES:
+        try:
+            lazy_import(name)
+        except ImportError:
+            pass
+
+
+def import_report():
+    """One row per heavy module: whether it is loaded yet and its measured import time
+    (a submodule's time counts for its package, e.g. finvizfinance.screener.custom)."""
+    rows = []
+    for name in HEAVY_MODULES:
+        times = [t for mod, t in IMPORT_TIMES.items() if mod == name or mod.startswith(name + '.')]
+        rows.append({
+            'Module': name,
+            'Loaded': name in sys.modules,
+            'Import ms': round(max(times) * 1000, 1) if times else None,
+        })
+    return rows
+
@@ -0,0 +1,105 @@
+import os
+import threading
+import time
+from urllib.parse import urlsplit
+
+from metrics import count_error
+from startup import lazy_import
+
+# --- TRANSPORT CONFIGURATION ---
+POOL_SIZE = 32                 # keep-alive connections held by the requests (Finviz) pool
+MAX_RETRIES = 4                # extra attempts after an HTTP 429
+BACKOFF_BASE = 0.5             # seconds; doubles every attempt
+BACKOFF_CAP = 30.0
+
+# Concurrent requests allowed per host; STOCKPICKER_HOST_LIMITS="finviz.com=2,..." overrides
+HOST_LIMITS = {
+    'query1.finance.yahoo.com': 8,
+    'query2.finance.yahoo.com': 8,
+    'fc.yahoo.com': 2,
+    'finviz.com': 2,
+    'elite.finviz.com': 2,
+}
+DEFAULT_HOST_LIMIT = 4
+
+for _item in filter(None, os.environ.get('STOCKPICKER_HOST_LIMITS', '').split(',')):
+    _host, _limit = _item.split('=')
+    HOST_LIMITS[_host.strip()] = int(_limit)
+
+
+def backoff_delay(attempt, retry_after=None):
+    """Seconds to wait before retry number attempt+1: the server's Retry-After when it
+    sends seconds, otherwise capped exponential backoff."""
+    try:
+        return min(float(retry_after), BACKOFF_CAP)
+    except (TypeError, ValueError):
+        return min(BACKOFF_BASE * (2 ** attempt), BACKOFF_CAP)
+
+
+class HostLimiter:
+    """One semaphore per host, created on first use."""
+
+    def __init__(self, limits=None, default=DEFAULT_HOST_LIMIT):
+        self.limits = dict(HOST_LIMITS if limits is None else limits)
+        self.default = default
+        self.semaphores = {}
+        self.lock = threading.Lock()
+
+    def get(self, host):
+        with self.lock:
+            sem = self.semaphores.get(host)
+            if sem is None:
+                sem = self.semaphores[host] = threading.BoundedSemaphore(self.limits.get(host, self.default))
+            return sem
+
+
+class LimitedSessionMixin:
+    """Mixed into a requests / curl_cffi Session: every request waits for its host's
+    slot, and HTTP 429 responses are retried with exponential backoff instead of
+    being handed back to the caller on the first try."""
+
+    limiter = None
+    max_retries = MAX_RETRIES
+    sleep = staticmethod(time.sleep)
+
+    def request(self, method, url, *args, **kwargs):
+        host = urlsplit(url).hostname or ''
+        for attempt in range(self.max_retries + 1):
+            with self.limiter.get(host):
+                response = super().request(method, url, *args, **kwargs)
+            if response.status_code != 429 or attempt == self.max_retries:
+                return response
+            count_error(f"http.429.{host}")
+            self.sleep(backoff_delay(attempt, response.headers.get('Retry-After')))
+        return response
+
+
+LIMITER = HostLimiter()
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+def yahoo_session():
+    """Process-wide curl_cffi session (the type yfinance requires) shared by every
+    yfinance call. It keeps one curl handle per worker thread, and each handle
+    reuses its keep-alive connections across calls."""
+    with _sessions_lock:
+        if 'yahoo' not in _sessions:
+            curl = lazy_import('curl_cffi.requests')
+            cls = type('YahooSession', (LimitedSessionMixin, curl.Session), {'limiter': LIMITER})
+            _sessions['yahoo'] = cls(impersonate="chrome")
+        return _sessions['yahoo']
+
+def finviz_session():
+    """Process-wide requests session with a pooled adapter, installed into
+    finvizfinance so every screener call reuses its connections."""
+    with _sessions_lock:
+        if 'finviz' not in _sessions:
+            requests = lazy_import('requests')
+            cls = type('FinvizSession', (LimitedSessionMixin, requests.Session), {'limiter': LIMITER})
+            session = cls()
+            adapter = requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=POOL_SIZE)
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            lazy_import('finvizfinance.util').set_session(session)
+            _sessions['finviz'] = session
+        return _sessions['finviz']
@@ -0,0 +1,243 @@
+import glob
+import os
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from cache import SingleFlight
+from metrics import timed
+from providers import get_provider
+
+# --- SNAPSHOT CONFIGURATION ---
+UNIVERSE_DIR = os.environ.get('STOCKPICKER_UNIVERSE_DIR', os.path.join('data', 'universe'))
+REFRESH_SECONDS = 6 * 60 * 60
+
+# Finviz custom-screener column ids for everything the strategies, sorts and sector index read:
+# Ticker, Company, Sector, Market Cap, P/E, P/B, P/FCF, Sales Q/Q, Insider Trans, Float Short,
+# Debt/Eq, Oper M, Profit M, Perf Year, 52W High, RSI, Price, Change
+UNIVERSE_COLUMNS = [1, 2, 3, 6, 7, 11, 13, 23, 27, 30, 38, 40, 41, 46, 57, 59, 65, 66]
+
+# --- STRATEGY TABLE ---
+# 'fixed' filters always apply; 'user' lists the sidebar selections the strategy honours.
+STRATEGIES = {
+    "Custom (Manual)": {
+        'fixed': {},
+        'user': ['Sector', 'Market Cap.', 'P/E', 'P/B', 'Debt/Equity'],
+    },
+    "Insider Buying (Follow the Money)": {
+        'fixed': {'InsiderTransactions': 'Positive (>0%)', 'P/B': 'Under 3'},
+        'user': ['Market Cap.'],
+    },
+    "Oversold Quality (Dip Buying)": {
+        'fixed': {'RSI (14)': 'Oversold (30)', 'Debt/Equity': 'Under 0.5', 'Net Profit Margin': 'Positive (>0%)'},
+        'user': ['Market Cap.'],
+    },
+    "Short Squeeze (High Risk/Reward)": {
+        'fixed': {'Float Short': 'High (>20%)', 'Performance': 'Today Up'},
+        'user': ['Market Cap.'],
+    },
+}
+
+MARKET_CAPS = ["Any", "Micro ($50mln to $300mln)", "Small ($300mln to $2bln)", "Mid ($2bln to $10bln)", "Large ($10bln to $200bln)"]
+
+# Sidebar sort label -> Finviz order name
+SORT_MAP = {
+    "Lowest P/E (Cheapest Earnings)": "Price/Earnings",
+    "Lowest P/B (Cheapest Assets)": "Price/Book",
+    "Worst Performance (Biggest Discount)": "Performance (Year)"
+}
+
+# Finviz order name -> snapshot column (always ascending, missing values last)
+SORT_COLUMNS = {
+    "Price/Earnings": 'P/E',
+    "Price/Book": 'P/B',
+    "Performance (Year)": 'Perf Year',
+}
+
+# Finviz filter name -> snapshot column
+FILTER_COLUMNS = {
+    'Sector': 'Sector',
+    'Market Cap.': 'Market Cap',
+    'P/E': 'P/E',
+    'P/B': 'P/B',
+    'Debt/Equity': 'Debt/Eq',
+    'InsiderTransactions': 'Insider Trans',
+    'RSI (14)': 'RSI',
+    'Net Profit Margin': 'Profit M',
+    'Float Short': 'Float Short',
+    'Performance': 'Change',
+}
+
+# Finviz option -> open interval (lo, hi). Percent columns are fractions (20% -> 0.2).
+# Plain "Under X" options are parsed in option_range().
+OPTION_RANGES = {
+    ('Market Cap.', 'Micro ($50mln to $300mln)'): (50e6, 300e6),
+    ('Market Cap.', 'Small ($300mln to $2bln)'): (300e6, 2e9),
+    ('Market Cap.', 'Mid ($2bln to $10bln)'): (2e9, 10e9),
+    ('Market Cap.', 'Large ($10bln to $200bln)'): (10e9, 200e9),
+    ('InsiderTransactions', 'Positive (>0%)'): (0, np.inf),
+    ('RSI (14)', 'Oversold (30)'): (-np.inf, 30),
+    ('Net Profit Margin', 'Positive (>0%)'): (0, np.inf),
+    ('Float Short', 'High (>20%)'): (0.20, np.inf),
+    ('Performance', 'Today Up'): (0, np.inf),
+}
+
+
+def build_filters(strategy, selections):
+    """Finviz filters_dict for a strategy; selections maps filter name -> sidebar choice."""
+    spec = STRATEGIES[strategy]
+    filters_dict = {}
+    for name in spec['user']:
+        option = selections.get(name, "Any")
+        if option and option != "Any":
+            filters_dict[name] = option
+    filters_dict.update(spec['fixed'])
+    return filters_dict
+
+
+def option_range(name, option):
+    if (name, option) in OPTION_RANGES:
+        return OPTION_RANGES[(name, option)]
+    if option.startswith("Under "):
+        return -np.inf, float(option[len("Under "):])
+    raise ValueError(f"No local rule for filter {name}={option}")
+
+
+def filter_mask(frame, filters_dict=None, shape=None):
+    """Boolean mask of the rows passing Finviz-style filters. frame is a snapshot
+    DataFrame, or any column -> array mapping (e.g. date x ticker matrices) together
+    with the arrays' shape."""
+    mask = np.ones(shape or len(frame), dtype=bool)
+    for name, option in (filters_dict or {}).items():
+        values = frame[FILTER_COLUMNS[name]]
+        if name == 'Sector':
+            mask &= np.asarray(values == option)
+        else:
+            lo, hi = option_range(name, option)
+            if hasattr(values, 'to_numpy'):
+                arr = values.to_numpy(dtype=np.float64, na_value=np.nan)
+            else:
+                arr = np.asarray(values)
+            mask &= (arr > lo) & (arr < hi)
+    return mask
+
+
+def screen_snapshot(snapshot, filters_dict=None, order='Price/Earnings'):
+    """Evaluates Finviz-style filters and sort order against a local snapshot."""
+    result = snapshot[filter_mask(snapshot, filters_dict)]
+    sort_column = SORT_COLUMNS.get(order)
+    if sort_column:
+        result = result.sort_values(sort_column, kind='stable', na_position='last')
+    return result.reset_index(drop=True)
+
+
+def fetch_universe():
+    """Full-market Finviz custom screen with UNIVERSE_COLUMNS."""
+    df = get_provider().universe(UNIVERSE_COLUMNS)
+    for col in df.columns:
+        if col not in ('Ticker', 'Company', 'Sector'):
+            df[col] = pd.to_numeric(df[col], errors='coerce')
+    return df
+
+
+class UniverseSnapshot:
+    """Dated Parquet snapshots of the whole Finviz universe, refreshed once per window."""
+
+    def __init__(self, directory=UNIVERSE_DIR, refresh_seconds=REFRESH_SECONDS, fetch=fetch_universe):
+        self.directory = directory
+        self.refresh_seconds = refresh_seconds
+        self.fetch = fetch
+        self.lock = threading.Lock()
+        self.flight = SingleFlight()
+        self.refreshing = False
+        self._frame = None
+        self._frame_key = None
+
+    def latest_path(self):
+        paths = sorted(glob.glob(os.path.join(self.directory, '*.parquet')))
+        return paths[-1] if paths else None
+
+    def age(self):
+        """Seconds since the newest snapshot was written, None if there is none."""
+        path = self.latest_path()
+        return time.time() - os.path.getmtime(path) if path else None
+
+    def is_stale(self):
+        age = self.age()
+        return age is None or age > self.refresh_seconds
+
+    def load(self):
+        """Newest snapshot as a DataFrame (memoized until the file changes), or None."""
+        path = self.latest_path()
+        if path is None:
+            return None
+        key = (path, os.path.getmtime(path))
+        with self.lock:
+            if self._frame_key != key:
+                self._frame = pd.read_parquet(path)
+                self._frame_key = key
+            return self._frame
+
+    def build(self):
+        """Fetches a fresh universe and writes today's snapshot file. Callers that
+        arrive while a build is running wait for it instead of starting a second
+        full-market scrape."""
+        return self.flight.do('build', self._build)
+
+    def _build(self):
+        df = self.fetch()
+        if df is None or df.empty:
+            return None
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f"{datetime.now():%Y-%m-%d}.parquet")
+        tmp = path + '.tmp'
+        df.to_parquet(tmp, index=False)
+        os.replace(tmp, path)
+        return path
+
+    def get(self):
+        """Newest snapshot, fetching synchronously if it is stale or missing."""
+        if self.is_stale():
+            self.build()
+        return self.load()
+
+    def refresh_async(self):
+        """Rebuilds in a background thread if stale and no rebuild is running."""
+        with self.lock:
+            if self.refreshing or not self.is_stale():
+                return False
+            self.refreshing = True
+
+        def run():
+            try:
+                with timed('universe.refresh'):
+                    self.build()
+            except:
+                pass
+            finally:
+                with self.lock:
+                    self.refreshing = False
+
+        threading.Thread(target=run, name="universe-refresh", daemon=True).start()
+        return True
+
+
+_default_snapshot = None
+_default_lock = threading.Lock()
+
+def get_universe_snapshot():
+    """Process-wide UniverseSnapshot (the scanner's local mode and the sector index
+    share it, so one scrape serves both)."""
+    global _default_snapshot
+    with _default_lock:
+        if _default_snapshot is None:
+            _default_snapshot = UniverseSnapshot()
+        return _default_snapshot
+
+
+if __name__ == "__main__":
+    path = UniverseSnapshot().build()
+    print(f"Wrote {path}")